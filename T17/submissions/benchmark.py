@@ -0,0 +1,1015 @@
+"""
+=================================BENCHMARKS=================================
+Timing benchmarks for the Task Manager storage code. Run the file with the
+names of the benchmarks to run, or with no names to run all of them:
+    python benchmark.py dates
+
+Benchmarks also check the results of the code they time, and the script
+exits with status 1 if any check failed, so it can be run automatically.
+
+Every benchmark works on generated tasks in a temporary folder, so the real
+tasks.txt and user.txt files are never touched.
+"""
+
+# Import libraries
+import asyncio
+import gc
+import io
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+import task_api
+from credentials import Credentials
+import task_manager
+import task_server
+from storage import TextBackend
+from task_archive import ARCHIVE_DAYS
+from task_binary import BinaryTaskFile, text_to_binary, binary_to_text
+from task_columns import TaskColumns, numpy
+from task_files import file_state
+from task_mmap import TaskFileMap
+from task_pager import TaskPager
+from task_record import Task, DATETIME_STRING_FORMAT, format_ordinal, parse_date, parse_ordinal, parse_task, escape_field
+from task_render import write_rendered
+from task_stats import TaskStats
+from task_store import TaskStore, TaskConflictError
+from user_store import UserStore
+
+# Number of generated tasks and users used by the benchmarks
+TASK_COUNT = 200000
+USER_COUNT = 1000
+
+# Number of sessions run at once by the stress test, how many operations
+# each one makes, and how often they compact the shared task files
+STRESS_PROCESSES = 4
+STRESS_OPERATIONS = 300
+STRESS_COMPACT_THRESHOLD = 50
+
+# Number of sessions completing tasks in place while the stress test runs
+STRESS_COMPLETERS = 2
+
+# Number of tasks imported by the bulk import benchmark
+BULK_COUNT = 50000
+
+# Number of edits made through the menus by the soak test, and how often
+# the call stack depth and memory in use are measured
+SOAK_EDITS = 100000
+SOAK_SAMPLE = 10000
+
+# Number of clients the server load generator connects at once, how many
+# requests each sends, and how many tasks the server starts with
+LOAD_CLIENTS = 50
+LOAD_REQUESTS = 400
+LOAD_TASKS = 20000
+
+# Number of users logging in for the login benchmark
+LOGIN_USERS = 64
+
+# Number of random titles and descriptions round tripped through the task
+# files, and the characters they are made of, weighted towards separators
+# and escapes
+ROUND_TRIP_COUNT = 3000
+ROUND_TRIP_CHARACTERS = ";;\n\n\r\\\\snr# abcé€𝄞"
+
+# Number of times each way of parsing task lines is timed, keeping the
+# fastest, and how much slower than the original split the escaped format
+# may be timed before it counts as slower, which allows for timer noise
+PARSE_ROUNDS = 9
+PARSE_NOISE = 1.1
+
+
+class CheckFailed(Exception):
+    '''Raised when a benchmark finds the code it timed gave wrong results'''
+
+
+def check(passed, message):
+    '''Raises CheckFailed with a message unless a benchmark check passed'''
+    if not passed:
+        raise CheckFailed(message)
+
+
+def timed(function, *args):
+    '''Runs a function once and returns how long it took in seconds'''
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def make_date_strings(count, seed=1):
+    '''Creates task date strings spread over about three years, so that like
+        real task files most dates are shared by many tasks
+    '''
+    rand = random.Random(seed)
+    first_day = datetime(2023, 1, 1)
+    return [
+        (first_day + timedelta(days=rand.randrange(1000))).strftime(DATETIME_STRING_FORMAT)
+        for _ in range(count)
+    ]
+
+
+def write_task_file(path, count=TASK_COUNT, user_count=USER_COUNT, seed=1):
+    '''Writes a task file of generated tasks in the tasks.txt format'''
+    rand = random.Random(seed)
+    due_dates = make_date_strings(count, seed)
+    with open(path, "w") as task_file:
+        lines = []
+        for task_id in range(1, count + 1):
+            lines.append(";".join([
+                str(task_id),
+                f"user{rand.randrange(user_count)}",
+                f"Task {task_id}",
+                f"Description of task {task_id}",
+                due_dates[task_id - 1],
+                "2022-12-01",
+                rand.choice(["Yes", "No "])
+            ]))
+        task_file.write("\n".join(lines))
+
+
+def bench_dates():
+    '''Compares datetime.strptime with parse_date on task date strings'''
+    date_strings = make_date_strings(TASK_COUNT)
+    strptime_time = timed(lambda: [datetime.strptime(d, DATETIME_STRING_FORMAT) for d in date_strings])
+    # The fast path without the cache, then with a cache that starts empty
+    sliced_time = timed(lambda: [parse_date.__wrapped__(d) for d in date_strings])
+    parse_date.cache_clear()
+    cached_time = timed(lambda: [parse_date(d) for d in date_strings])
+    print(f"Parsing {TASK_COUNT} date strings:")
+    print(f"  datetime.strptime:      {strptime_time:.3f}s")
+    print(f"  parse_date (no cache):  {sliced_time:.3f}s\t {strptime_time / sliced_time:.1f}x faster")
+    print(f"  parse_date:             {cached_time:.3f}s\t {strptime_time / cached_time:.1f}x faster")
+    # Time a full load of a task file, which parses two dates per task
+    with tempfile.TemporaryDirectory() as folder:
+        task_path = os.path.join(folder, "tasks.txt")
+        write_task_file(task_path)
+        parse_date.cache_clear()
+        store = TaskStore(task_path, os.path.join(folder, "tasks.log"))
+        print(f"Loading {TASK_COUNT} tasks:   {timed(store.load):.3f}s")
+
+
+def traced_size(function, *args):
+    '''Runs a function and returns its result and the memory allocated by
+        the call that is still in use afterwards, measured with tracemalloc
+    '''
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = function(*args)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def parse_task_dict(t_str):
+    '''Creates a task dictionary the way read_tasks did before tasks were
+        stored as Task objects, to compare memory use against
+    '''
+    task_components = t_str.split(";")
+    return {
+        'id': int(task_components[0]),
+        'username': task_components[1],
+        'title': task_components[2],
+        'description': task_components[3],
+        'due_date': datetime.strptime(task_components[4], DATETIME_STRING_FORMAT),
+        'assigned_date': datetime.strptime(task_components[5], DATETIME_STRING_FORMAT),
+        'completed': task_components[6] == "Yes"
+    }
+
+
+def bench_memory():
+    '''Compares the memory used per task by task dictionaries and Tasks'''
+    with tempfile.TemporaryDirectory() as folder:
+        task_path = os.path.join(folder, "tasks.txt")
+        write_task_file(task_path)
+        with open(task_path, "r") as task_file:
+            task_data = task_file.read().split("\n")
+    # Both versions share the same line strings, so only the task objects,
+    # their field values and the list holding them are measured
+    parse_date.cache_clear()
+    _, dict_size = traced_size(lambda: [parse_task_dict(t) for t in task_data])
+    _, task_size = traced_size(lambda: [parse_task(t, 0) for t in task_data])
+    print(f"Memory for {len(task_data)} tasks:")
+    print(f"  dictionaries: {dict_size / len(task_data):.0f} bytes per task")
+    print(f"  Task objects: {task_size / len(task_data):.0f} bytes per task"
+          f"\t {100 * (1 - task_size / dict_size):.0f}% less")
+
+
+def random_text(rand):
+    '''Returns a short random string of separators, escapes and letters'''
+    return "".join(rand.choice(ROUND_TRIP_CHARACTERS) for _ in range(rand.randrange(12)))
+
+
+def text_backend(task_path, **options):
+    '''Opens a task file through the storage backend the Task Manager uses'''
+    return TextBackend(TaskStore(task_path, **options))
+
+
+def round_trip_failures(expected, task_path):
+    '''Reads the tasks back from the task files every way the storage
+        backend can, returning the names of the ways that did not give the
+        expected tasks
+    '''
+    failures = []
+    if text_backend(task_path).tasks() != expected:
+        failures.append("tasks")
+    if list(text_backend(task_path).iter_tasks()) != expected:
+        failures.append("iter_tasks")
+    if [text_backend(task_path).get(task.id) for task in expected[::97]] != expected[::97]:
+        failures.append("get")
+    pager = text_backend(task_path).pager(100)
+    if [task for page in range(1, pager.page_count() + 1) for task in pager.page(page)] != expected:
+        failures.append("pages")
+    return failures
+
+
+def split_task(t_str, line_number):
+    '''Parses a task line the way parse_task did before the escaped format
+        was added, with a plain split, as the throughput to match
+    '''
+    task_components = t_str.split(";")
+    if len(task_components) == 7:
+        task_id = int(task_components.pop(0))
+    else:
+        task_id = line_number
+    return Task(
+        task_id,
+        task_components[0],
+        task_components[1],
+        task_components[2],
+        parse_ordinal(task_components[3]),
+        parse_ordinal(task_components[4]),
+        task_components[5] == "Yes"
+    )
+
+
+def fastest_times(functions, rounds=PARSE_ROUNDS):
+    '''Runs each function once per round, taking turns so that they all
+        see the same machine load, and returns the fastest time of each in
+        seconds. Garbage collection is left off while a function runs.
+    '''
+    times = [[] for _ in functions]
+    for _ in range(rounds):
+        for function_times, function in zip(times, functions):
+            gc.disable()
+            try:
+                function_times.append(timed(function))
+            finally:
+                gc.enable()
+    return [min(function_times) for function_times in times]
+
+
+def bench_escaping():
+    '''Round trips random titles and descriptions full of separators and
+        escapes through the task files with the storage backend, the way the
+        Task Manager saves and loads them, and checks that reading task lines
+        in the escaped format is at least as fast as the plain split of the
+        original format
+    '''
+    rand = random.Random(1)
+    with tempfile.TemporaryDirectory() as folder:
+        task_path = os.path.join(folder, "tasks.txt")
+        backend = text_backend(task_path, compact_threshold=ROUND_TRIP_COUNT + 1, archive_days=0)
+        for _ in range(ROUND_TRIP_COUNT):
+            backend.add(random_text(rand) or "user", random_text(rand), random_text(rand),
+                        date(2024, 1, 1), date(2023, 1, 1), rand.random() < 0.5)
+        expected = [task.copy() for task in backend.tasks()]
+        log_failures = round_trip_failures(expected, task_path)
+        backend.compact()
+        snapshot_failures = round_trip_failures(expected, task_path)
+        # Archive the completed tasks, recorded as completed long ago
+        # (compact leaves the snapshot alone once the log is empty, so the
+        # snapshot is rewritten with replace_all instead)
+        archive_backend = text_backend(task_path, archive_days=ARCHIVE_DAYS)
+        record_completion_days(archive_backend.task_store, expected)
+        archive_backend.replace_all(list(text_backend(task_path).iter_tasks()))
+        archive = archive_backend.task_store.archive
+        archived = sorted([*archive.iter_tasks(), *text_backend(task_path).iter_tasks()], key=lambda task: task.id)
+        plain_path = os.path.join(folder, "plain.txt")
+        write_task_file(plain_path)
+        with open(plain_path, "r") as task_file:
+            task_data = task_file.read().split("\n")
+    # Every tenth line gets a description that needs escaping
+    escaped_data = [
+        t_str.replace("Description", escape_field("Description; with\na new line")) if i % 10 == 0 else t_str
+        for i, t_str in enumerate(task_data)
+    ]
+    # Parse once first so every timing below finds the dates already cached
+    [parse_task(t_str, 0) for t_str in task_data]
+    split_time, plain_time, escaped_time = fastest_times([
+        lambda: [split_task(t_str, 0) for t_str in task_data],
+        lambda: [parse_task(t_str, 0, True) for t_str in task_data],
+        lambda: [parse_task(t_str, 0, True) for t_str in escaped_data],
+    ])
+    print(f"Round tripping {ROUND_TRIP_COUNT} random titles and descriptions:")
+    print(f"  through the change log: {', '.join(log_failures) or 'all match'}")
+    print(f"  through the snapshot:   {', '.join(snapshot_failures) or 'all match'}")
+    print(f"  through the archive:    {'all match' if archived == expected else 'mismatch'}")
+    check(not log_failures, f"round trip through the change log: {', '.join(log_failures)}")
+    check(not snapshot_failures, f"round trip through the snapshot: {', '.join(snapshot_failures)}")
+    check(archived == expected, "round trip through the archive")
+    print(f"Parsing {len(task_data)} task lines (fastest of {PARSE_ROUNDS} runs):")
+    print(f"  original split:            {split_time:.3f}s")
+    print(f"  escaped format:            {plain_time:.3f}s\t {split_time / plain_time:.2f}x the split throughput")
+    print(f"  escaped, 10% with escapes: {escaped_time:.3f}s")
+    check(plain_time <= split_time * PARSE_NOISE,
+          "the escaped format is read slower than the original split")
+
+
+def row_user_counts(tasks, today_ordinal):
+    '''Counts the tasks of each user one task at a time, to compare against
+        the column counts
+    '''
+    user_counts = {}
+    for task in tasks:
+        counts = user_counts.setdefault(task.username, [0, 0, 0, 0])
+        counts[0] += 1
+        if task.completed:
+            counts[1] += 1
+        else:
+            counts[2] += 1
+            if task.due <= today_ordinal:
+                counts[3] += 1
+    return user_counts
+
+
+def bench_columns():
+    '''Compares counting the overview reports task by task and by columns'''
+    with tempfile.TemporaryDirectory() as folder:
+        task_path = os.path.join(folder, "tasks.txt")
+        write_task_file(task_path)
+        store = TaskStore(task_path, os.path.join(folder, "tasks.log"), archive_days=0).load()
+        tasks = store.tasks
+        today_ordinal = datetime(2024, 6, 1).toordinal()
+        build_time = timed(TaskColumns.from_tasks, tasks)
+        columns = TaskColumns.from_tasks(tasks)
+        row_time = timed(row_user_counts, tasks, today_ordinal)
+        column_time = timed(columns.user_counts, today_ordinal)
+        check(columns.user_counts(today_ordinal) == row_user_counts(tasks, today_ordinal),
+              "column counts differ from counting task by task")
+        # A report after an edit uses the columns the store keeps up to date
+        backend = TextBackend(store)
+        backend.report_counts(today_ordinal)
+        store.set_completed(1, not store.get(1).completed)
+        store.reassign(2, "user1")
+        edit_time = timed(backend.report_counts, today_ordinal)
+        check(backend.report_counts(today_ordinal)[1] == row_user_counts(tasks, today_ordinal),
+              "report counts after an edit differ from counting task by task")
+    print(f"Counting the overview reports for {len(tasks)} tasks:")
+    print(f"  building the columns:  {build_time:.3f}s (once per load of the task files)")
+    print(f"  report after an edit:  {edit_time:.3f}s")
+    print(f"  task by task:          {row_time:.3f}s")
+    print(f"  by columns ({'NumPy' if numpy is not None else 'no NumPy'}):  "
+          f"{column_time:.3f}s\t {row_time / column_time:.1f}x faster")
+
+
+def stress_store(folder):
+    '''Opens the task store in a stress test folder'''
+    return TaskStore(os.path.join(folder, "tasks.txt"), os.path.join(folder, "tasks.log"),
+                     os.path.join(folder, "task_stats.json"), STRESS_COMPACT_THRESHOLD)
+
+
+def stress_session(folder, worker):
+    '''One session of the stress test. Each operation adds a task and then
+        moves the due date of task 1 on by a day, reading the task and
+        writing it back with an optimistic check, retrying on a conflict
+    '''
+    store = stress_store(folder)
+    for n in range(STRESS_OPERATIONS):
+        store.add(f"worker{worker}", f"worker{worker} task {n}", "stress test", date(2030, 1, 1), date(2024, 1, 1))
+        while True:
+            task = store.get(1)
+            try:
+                store.set_due_date(1, task.due_date + timedelta(days=1), expected=task.fields())
+                break
+            except TaskConflictError:
+                continue
+
+
+def stress_completer(folder, task_ids, in_place, wrong_reads):
+    '''A completing session of the stress test. Each task is completed by a
+        new session that has not loaded the task list, so the completion is
+        written in place in tasks.txt, and then read back by another new
+        session through the line offset index
+    '''
+    for task_id in task_ids:
+        store = stress_store(folder)
+        store.set_completed(task_id)
+        if not store.loaded:
+            with in_place.get_lock():
+                in_place.value += 1
+        task = stress_store(folder).get(task_id)
+        if task is None or task.id != task_id or not task.completed:
+            with wrong_reads.get_lock():
+                wrong_reads.value += 1
+
+
+def bench_stress():
+    '''Runs several sessions against the same task files at once, some of
+        them completing tasks in place while the others log their edits, and
+        checks that no added task, due date change or completion was lost
+    '''
+    with tempfile.TemporaryDirectory() as folder:
+        first_due = date(2030, 1, 1)
+        store = stress_store(folder)
+        store.add("admin", "Counter", "Due date moves on a day per edit", first_due, first_due)
+        # Tasks for the completing sessions, written to the snapshot so they
+        # can be completed in place
+        to_complete = [task.id for task in store.add_many(
+            [("admin", f"complete {n}", "stress test", first_due, first_due, False)
+             for n in range(STRESS_COMPLETERS * STRESS_OPERATIONS)])]
+        store.compact()
+        in_place = multiprocessing.Value('i', 0)
+        wrong_reads = multiprocessing.Value('i', 0)
+        sessions = [
+            multiprocessing.Process(target=stress_session, args=(folder, worker))
+            for worker in range(STRESS_PROCESSES)
+        ] + [
+            multiprocessing.Process(target=stress_completer,
+                                    args=(folder, to_complete[worker::STRESS_COMPLETERS], in_place, wrong_reads))
+            for worker in range(STRESS_COMPLETERS)
+        ]
+        start = time.perf_counter()
+        for session in sessions:
+            session.start()
+        for session in sessions:
+            session.join()
+        elapsed = time.perf_counter() - start
+        check(all(session.exitcode == 0 for session in sessions), "a session stopped with an error")
+        # Check the final task files from a fresh store
+        tasks = stress_store(folder).load().tasks
+    operations = STRESS_PROCESSES * STRESS_OPERATIONS
+    titles = {task.title for task in tasks}
+    expected_titles = {f"worker{w} task {n}" for w in range(STRESS_PROCESSES) for n in range(STRESS_OPERATIONS)}
+    lost_adds = len(expected_titles - titles)
+    duplicate_ids = len(tasks) - len({task.id for task in tasks})
+    lost_edits = operations - (tasks[0].due - first_due.toordinal())
+    completed_ids = {task.id for task in tasks if task.completed}
+    lost_completions = len(set(to_complete) - completed_ids)
+    print(f"{STRESS_PROCESSES} sessions making {operations} adds and {operations} edits, and "
+          f"{STRESS_COMPLETERS} sessions making {len(to_complete)} completions in {elapsed:.2f}s"
+          f" ({(2 * operations + len(to_complete)) / elapsed:.0f} operations per second)")
+    print(f"  lost adds: {lost_adds}, duplicate ids: {duplicate_ids}, lost edits: {lost_edits}, "
+          f"lost completions: {lost_completions} ({in_place.value} written in place), "
+          f"wrong reads: {wrong_reads.value}")
+    check(not (lost_adds or duplicate_ids or lost_edits or lost_completions or wrong_reads.value),
+          "sessions lost or duplicated changes")
+    check(in_place.value > 0, "no completion was written in place")
+
+
+def bench_sidecars():
+    '''Keeps two task files in one folder, each with logged edits, and
+        checks that rewriting one leaves the change log of the other alone
+    '''
+    with tempfile.TemporaryDirectory() as folder:
+        first = TaskStore(os.path.join(folder, "tasks.txt"), archive_days=0)
+        second = TaskStore(os.path.join(folder, "t2.txt"), archive_days=0)
+        for store in (first, second):
+            for n in range(4):
+                store.add("admin", f"Task {n}", "two files in one folder", date(2030, 1, 1), date(2024, 1, 1))
+            store.set_completed(1)
+            store.set_due_date(3, date(2031, 1, 1))
+            store.reassign(3, "user1")
+        expected = [task.copy() for task in first.tasks]
+        # Rewrite the second snapshot, which empties its own change log
+        second.compact()
+        first_log_kept = os.path.exists(first.log_path)
+        reloaded = TaskStore(first.task_path, archive_days=0).load().tasks
+    first_files = {first.log_path, first.stats_path, first.archive.index_path}
+    second_files = {second.log_path, second.stats_path, second.archive.index_path}
+    print("Two task files in one folder:")
+    print(f"  shared files:          {len(first_files & second_files)}")
+    print(f"  first change log kept: {'yes' if first_log_kept else 'no'}")
+    print(f"  first tasks reloaded:  {'all match' if reloaded == expected else 'mismatch'}")
+    check(not first_files & second_files, "task files in one folder share their files")
+    check(first_log_kept and reloaded == expected, "rewriting one task file lost the edits of another")
+
+
+def bench_pages():
+    '''Compares loading every task to show the first page with paging
+        through the line offset index
+    '''
+    with tempfile.TemporaryDirectory() as folder:
+        task_path = os.path.join(folder, "tasks.txt")
+        write_task_file(task_path)
+        store = TaskStore(task_path, os.path.join(folder, "tasks.log"))
+        load_time = timed(lambda: TaskStore(task_path, store.log_path).load().tasks[:10])
+        pager = TaskPager(store)
+        index_time = timed(pager.refresh)
+        last_page = pager.page_count()
+        first_time = timed(pager.page, 1)
+        last_time = timed(pager.page, last_page)
+        jump_time = timed(lambda: pager.page(pager.page_of(TASK_COUNT // 2)))
+    print(f"Showing a page of {pager.page_size} out of {TASK_COUNT} tasks:")
+    print(f"  loading every task:    {load_time:.3f}s")
+    print(f"  building the index:    {index_time:.3f}s (once per change of the task files)")
+    print(f"  first page:            {first_time * 1000:.2f}ms")
+    print(f"  last page:             {last_time * 1000:.2f}ms")
+    print(f"  jump to a Task#:       {jump_time * 1000:.2f}ms")
+
+
+def bench_mmap():
+    '''Compares loading every task to read or complete a single task with
+        going through the saved line offset index of the task file
+    '''
+    with tempfile.TemporaryDirectory() as folder:
+        task_path = os.path.join(folder, "tasks.txt")
+        write_task_file(task_path)
+        paths = (task_path, os.path.join(folder, "tasks.log"), os.path.join(folder, "task_stats.json"))
+        task_id = TASK_COUNT // 2
+        load_time = timed(lambda: TaskStore(*paths).load().get(task_id))
+        build_time = timed(TaskFileMap(task_path).refresh)
+        saved_time = timed(TaskFileMap(task_path).refresh)
+        get_time = timed(lambda: TaskStore(*paths).get(task_id))
+        logged_time = timed(lambda: TaskStore(*paths).load().set_completed(task_id + 1))
+        # Rewrite the snapshot so the statistics are saved alongside it, as
+        # they are after every compaction
+        TaskStore(*paths).load().compact()
+        check(os.path.exists(paths[2]), "statistics were not saved")
+        TaskFileMap(task_path).refresh()
+        patch_time = timed(lambda: TaskStore(*paths).set_completed(task_id + 2))
+        completion_recorded = task_id + 2 in TaskStore(*paths).archive.completion_days()
+        # Log some edits, then check a new session brings the statistics
+        # saved with the snapshot up to date instead of counting every task
+        store = TaskStore(*paths)
+        store.set_due_date(task_id + 3, date(2020, 1, 1))
+        store.set_completed(task_id + 4)
+        store.reassign(task_id + 5, "user0")
+        stats_kept = TaskStats.load(paths[2], file_state(task_path)) is not None
+        stats_time = timed(lambda: TaskStore(*paths).get_stats())
+        saved_stats = stats_summary(TaskStore(*paths).get_stats())
+        store = TaskStore(*paths).load()
+        counted_stats = stats_summary(TaskStats.from_tasks(store.tasks))
+        count_time = timed(lambda: TaskStats.from_tasks(TaskStore(*paths).load().tasks))
+        # Compaction may have archived tasks, so find the line by its task id
+        with open(task_path, "rb") as task_file:
+            prefix = f"{task_id + 2};".encode("utf-8")
+            patched = next(line for line in task_file if line.startswith(prefix)).decode("utf-8").rstrip("\n")
+    print(f"Reading and completing one of {TASK_COUNT} tasks in a new session:")
+    print(f"  loading every task:      {load_time:.3f}s")
+    print(f"  building the index:      {build_time:.3f}s (once per change of the task file)")
+    print(f"  loading the saved index: {saved_time * 1000:.2f}ms")
+    print(f"  reading one task:        {get_time * 1000:.2f}ms")
+    print(f"  loading and logging:     {logged_time:.3f}s")
+    print(f"  completing in place:     {patch_time * 1000:.2f}ms (with saved statistics)")
+    print(f"  patched line:            {patched}")
+    print(f"Statistics after logged edits and an in-place completion:")
+    print(f"  counting every task:     {count_time:.3f}s")
+    print(f"  saved and the log:       {stats_time:.3f}s\t {count_time / stats_time:.1f}x faster")
+    check(patched.endswith(";Yes"), "task was not completed in place")
+    check(completion_recorded, "completion day of a task completed in place was not recorded")
+    check(stats_kept, "saved statistics were not kept up to date")
+    check(saved_stats == counted_stats, "saved statistics differ from counting every task")
+
+
+def stats_summary(stats):
+    '''Returns the counts and incomplete task due dates of every user with
+        tasks, for comparing statistics
+    '''
+    return {username: (user.total, user.complete, user.incomplete_due.entries)
+            for username, user in stats.users.items() if user.total}
+
+
+def bench_binary():
+    '''Compares loading tasks.txt with loading the same tasks from the
+        binary task file, and the size of the two files
+    '''
+    with tempfile.TemporaryDirectory() as folder:
+        task_path = os.path.join(folder, "tasks.txt")
+        binary_path = os.path.join(folder, "tasks.bin")
+        log_path = os.path.join(folder, "tasks.log")
+        write_task_file(task_path)
+        text_tasks = TaskStore(task_path, log_path).load().tasks
+        convert_time = timed(text_to_binary, task_path, binary_path, log_path)
+        text_time = timed(lambda: TaskStore(task_path, log_path).load())
+        binary_time = timed(lambda: BinaryTaskFile.from_path(binary_path).tasks())
+        binary_file = BinaryTaskFile.from_path(binary_path)
+        # Count the overdue tasks from the records alone, creating no strings
+        today_ordinal = date(2024, 6, 1).toordinal()
+        count_time = timed(lambda: sum(1 for record in binary_file.records()
+                                       if not record[4] and record[2] <= today_ordinal))
+        same = binary_file.tasks() == text_tasks
+        text_size = os.path.getsize(task_path)
+        binary_size = os.path.getsize(binary_path)
+        # Round trip a second task file next to tasks.txt while tasks.txt
+        # has logged edits, which the conversions must leave alone
+        store = TaskStore(task_path, archive_days=0)
+        store.set_completed(1, not store.get(1).completed)
+        store.reassign(2, "user1")
+        expected = [task.copy() for task in store.tasks]
+        second_path = os.path.join(folder, "t2.txt")
+        second_binary_path = os.path.join(folder, "t2.bin")
+        second = TaskStore(second_path, archive_days=0)
+        for n in range(3):
+            second.add("admin", f"Task {n}", "second task file", date(2030, 1, 1), date(2024, 1, 1))
+        second.set_completed(2)
+        second_expected = [task.copy() for task in second.tasks]
+        text_to_binary(second_path, second_binary_path)
+        binary_to_text(second_binary_path, second_path)
+        second_same = TaskStore(second_path).load().tasks == second_expected
+        first_same = os.path.exists(store.log_path) and TaskStore(task_path).load().tasks == expected
+    print(f"Loading {TASK_COUNT} tasks:")
+    print(f"  tasks.txt:             {text_time:.3f}s, {text_size / 1e6:.1f}MB")
+    print(f"  tasks.bin:             {binary_time:.3f}s, {binary_size / 1e6:.1f}MB")
+    print(f"  converting to binary:  {convert_time:.3f}s")
+    print(f"  overdue count from the binary records: {count_time:.3f}s")
+    print(f"  same tasks: {same}")
+    print(f"  second task file round tripped: {second_same}, tasks.txt kept its edits: {first_same}")
+    check(same, "binary task file holds different tasks")
+    check(second_same, "second task file changed in a round trip through the binary format")
+    check(first_same, "converting a second task file changed tasks.txt")
+
+
+def record_completion_days(store, tasks):
+    '''Records the generated completed tasks as completed on the day they
+        were assigned, as if the archive had been recording them all along
+    '''
+    store.archive.save_completion_days({task.id: task.assigned for task in tasks if task.completed})
+
+
+def bench_archive():
+    '''Compares loading and counting every task with archiving the old
+        completed tasks first
+    '''
+    with tempfile.TemporaryDirectory() as folder:
+        task_path = os.path.join(folder, "tasks.txt")
+        write_task_file(task_path)
+        paths = (task_path, os.path.join(folder, "tasks.log"), os.path.join(folder, "task_stats.json"))
+        today_ordinal = date.today().toordinal()
+        full_size = os.path.getsize(task_path)
+        full_time = timed(lambda: TaskStore(*paths, archive_days=0).load())
+        full_counts = TextBackend(TaskStore(*paths, archive_days=0)).report_counts(today_ordinal)
+        tasks = list(TaskStore(*paths, archive_days=0).iter_tasks())
+        record_completion_days(TaskStore(*paths), tasks)
+        archive_time = timed(lambda: TaskStore(*paths, archive_days=ARCHIVE_DAYS).replace_all(tasks))
+        store = TaskStore(*paths, archive_days=ARCHIVE_DAYS)
+        hot_time = timed(store.load)
+        report_time = timed(TextBackend(store).report_counts, today_ordinal)
+        same = TextBackend(store).report_counts(today_ordinal) == full_counts
+        hot_size = os.path.getsize(task_path)
+        archive_size = sum(os.path.getsize(os.path.join(folder, segment)) for segment in store.archive.segments)
+        archived = len(store.archive)
+    print(f"Archiving tasks completed over {ARCHIVE_DAYS} days ago from {TASK_COUNT} tasks:")
+    print(f"  archived:              {archived} tasks in {archive_time:.3f}s (with the snapshot rewrite)")
+    print(f"  tasks.txt:             {full_size / 1e6:.1f}MB before, {hot_size / 1e6:.1f}MB after")
+    print(f"  compressed archive:    {archive_size / 1e6:.1f}MB")
+    print(f"  loading every task:    {full_time:.3f}s")
+    print(f"  loading active tasks:  {hot_time:.3f}s")
+    print(f"  report counts:         {report_time:.3f}s, same as before archiving: {same}")
+    check(same, "report counts changed by archiving")
+
+
+def print_task(task):
+    '''Prints a task the way display_task did before the task template,
+        to compare against the batched output
+    '''
+    disp_str = f"Task#: \t\t {task.id}\n"
+    disp_str += f"Task: \t\t {task.title}\n"
+    disp_str += f"Assigned to: \t {task.username}\n"
+    disp_str += f"Date Assigned: \t {format_ordinal(task.assigned)}\n"
+    disp_str += f"Due Date: \t {format_ordinal(task.due)}\n"
+    disp_str += f"Task Complete? \t {'Yes' if task.completed else 'No'}\n"
+    disp_str += f"Task Description: \n {task.description}\n"
+    print(f"{'_' * 60}\n{disp_str}")
+
+
+def bench_render():
+    '''Compares printing each task with writing the tasks in batches, to
+        a line buffered output like a terminal
+    '''
+    with tempfile.TemporaryDirectory() as folder:
+        task_path = os.path.join(folder, "tasks.txt")
+        write_task_file(task_path)
+        tasks = TaskStore(task_path, os.path.join(folder, "tasks.log")).load().tasks
+    console = sys.stdout
+    with open(os.devnull, "w", buffering=1) as terminal:
+        try:
+            sys.stdout = terminal
+            print_time = timed(lambda: [print_task(task) for task in tasks])
+            batch_time = timed(write_rendered, tasks)
+        finally:
+            sys.stdout = console
+    # Check both ways produce exactly the same text
+    printed = io.StringIO()
+    try:
+        sys.stdout = printed
+        for task in tasks[:1000]:
+            print_task(task)
+    finally:
+        sys.stdout = console
+    rendered = io.StringIO()
+    write_rendered(tasks[:1000], rendered)
+    check(printed.getvalue() == rendered.getvalue(), "template output differs from print")
+    print(f"Showing {len(tasks)} tasks on a line buffered output:")
+    print(f"  print per task:     {print_time:.3f}s")
+    print(f"  batched template:   {batch_time:.3f}s\t {print_time / batch_time:.1f}x faster")
+
+
+def api_storage(folder):
+    '''Creates a text storage backend with generated users in a folder'''
+    with open(os.path.join(folder, "user.txt"), "w") as user_file:
+        user_file.write("\n".join(f"user{n};password" for n in range(USER_COUNT)))
+    storage = text_storage(folder)
+    storage.initialise()
+    return storage
+
+
+def text_storage(folder, archive_days=None):
+    '''Opens the text storage backend of the task files in a folder'''
+    return TextBackend(
+        TaskStore(os.path.join(folder, "tasks.txt"), os.path.join(folder, "tasks.log"),
+                  os.path.join(folder, "task_stats.json"), archive_days=archive_days),
+        UserStore(os.path.join(folder, "user.txt")))
+
+
+def bench_api():
+    '''Times task operations run through task_api without the menus'''
+    operations = 20000
+    with tempfile.TemporaryDirectory() as folder:
+        storage = api_storage(folder)
+        due_dates = make_date_strings(operations)
+        rand = random.Random(1)
+        add_time = timed(lambda: [
+            task_api.add_task(f"user{rand.randrange(USER_COUNT)}", f"Task {n}", "API benchmark",
+                              due_dates[n], "2024-01-01", storage)
+            for n in range(operations)
+        ])
+        edit_time = timed(lambda: [
+            (task_api.set_due_date(n, due_dates[-n], storage),
+             task_api.reassign(n, f"user{n % USER_COUNT}", storage),
+             task_api.complete_task(n, storage))
+            for n in range(1, operations + 1)
+        ])
+        cwd = os.getcwd()
+        os.chdir(folder)
+        try:
+            report_time = timed(task_api.report, storage, "2024-06-01")
+        finally:
+            os.chdir(cwd)
+    print(f"Running task operations through task_api:")
+    print(f"  {operations} adds:   {add_time:.3f}s\t {operations / add_time:.0f} per second")
+    print(f"  {3 * operations} edits: {edit_time:.3f}s\t {3 * operations / edit_time:.0f} per second")
+    print(f"  report:        {report_time:.3f}s")
+
+
+def bench_bulk():
+    '''Compares adding tasks one at a time with a bulk import, and times
+        the bulk updates
+    '''
+    due_dates = make_date_strings(BULK_COUNT)
+    rand = random.Random(1)
+    rows = [
+        (f"user{rand.randrange(USER_COUNT)}", f"Task {n}", "Bulk benchmark", due_dates[n], "2024-01-01")
+        for n in range(BULK_COUNT)
+    ]
+    with tempfile.TemporaryDirectory() as folder:
+        storage = api_storage(folder)
+        single_time = timed(lambda: [task_api.add_task(*row, storage=storage) for row in rows])
+    with tempfile.TemporaryDirectory() as folder:
+        storage = api_storage(folder)
+        import_path = os.path.join(folder, "import.csv")
+        with open(import_path, "w", newline="") as import_file:
+            import_file.write("username,title,description,due_date,assigned_date\n")
+            import_file.write("".join(",".join(row) + "\n" for row in rows))
+        import_time = timed(task_api.import_tasks, import_path, None, storage)
+        complete_time = timed(task_api.complete_tasks, range(1, BULK_COUNT + 1, 2), storage)
+        reassign_time = timed(task_api.reassign_all, "user0", "user1", storage)
+        store = TaskStore(storage.task_store.task_path, storage.task_store.log_path).load()
+        # Tasks are archived once they have been complete for archive_days,
+        # so the tasks completed just now are only archived when that is 0
+        archived = len(store.archive)
+    check(archived == 0 or store.archive_days == 0, "recently completed tasks were archived")
+    check(len(store.tasks) + archived == BULK_COUNT, "bulk import lost tasks")
+    check(sum(task.completed for task in store.tasks) + archived == BULK_COUNT // 2,
+          "bulk complete missed tasks")
+    print(f"Adding {BULK_COUNT} tasks:")
+    print(f"  one at a time:        {single_time:.3f}s")
+    print(f"  bulk import (csv):    {import_time:.3f}s\t {single_time / import_time:.1f}x faster")
+    print(f"  complete {BULK_COUNT // 2} tasks:  {complete_time:.3f}s")
+    print(f"  reassign all of a user's tasks: {reassign_time:.3f}s")
+
+
+def stack_depth():
+    '''Returns the number of frames on the call stack'''
+    depth = 0
+    frame = sys._getframe()
+    while frame is not None:
+        depth += 1
+        frame = frame.f_back
+    return depth
+
+
+def bench_soak():
+    '''Makes SOAK_EDITS due date edits through the menus of a single
+        Task Manager session, checking the call stack and the memory in use
+        stay the same size however many edits are made
+    '''
+    with tempfile.TemporaryDirectory() as folder:
+        storage = api_storage(folder)
+        task = storage.add("user0", "Soak", "Soak test task", date(2030, 1, 1), date(2024, 1, 1))
+        due_dates = ["2030-01-01", "2030-01-02"]
+        # Log in, then view my tasks, choose the task and change its due
+        # date for each edit, then exit
+        def answers():
+            yield "user0"
+            yield "password"
+            for n in range(SOAK_EDITS):
+                yield from ("vm", str(task.id), "dd", due_dates[n % 2])
+                if n % SOAK_SAMPLE == SOAK_SAMPLE - 1:
+                    samples.append((stack_depth(), tracemalloc.get_traced_memory()[0]))
+            yield "ex"
+        samples = []
+        answer = answers()
+        console = sys.stdout
+        menu_storage = task_manager.storage
+        menu_credentials = task_manager.credentials
+        task_manager.storage = storage
+        # Hash the generated passwords cheaply, as only the menus are timed
+        task_manager.credentials = Credentials(storage, "pbkdf2", 1000)
+        task_manager.input = lambda prompt="": next(answer)
+        tracemalloc.start()
+        try:
+            with open(os.devnull, "w") as terminal:
+                sys.stdout = terminal
+                soak_time = timed(task_manager.main)
+        finally:
+            tracemalloc.stop()
+            sys.stdout = console
+            task_manager.storage = menu_storage
+            task_manager.credentials = menu_credentials
+            del task_manager.input
+        final_due = TaskStore(storage.task_store.task_path, storage.task_store.log_path).load().by_id[task.id].due
+    depths = [depth for depth, _ in samples]
+    memory = [size for _, size in samples]
+    growth = memory[-1] - memory[0]
+    print(f"{SOAK_EDITS} edits through the menus in one session: {soak_time:.2f}s"
+          f" ({SOAK_EDITS / soak_time:.0f} edits per second)")
+    print(f"  call stack depth every {SOAK_SAMPLE} edits: {', '.join(map(str, depths))}")
+    print(f"  memory in use after {SOAK_SAMPLE} edits: {memory[0] / 1024:.0f} KiB,"
+          f" after {SOAK_EDITS}: {memory[-1] / 1024:.0f} KiB ({growth / 1024:+.0f} KiB)")
+    check(len(set(depths)) == 1, "call stack grew with the number of edits")
+    check(growth <= 1024 * 1024, "memory in use grew with the number of edits")
+    check(final_due == date(2030, 1, 2).toordinal(), "last due date edit was lost")
+
+
+def server_process(folder, socket_path):
+    '''Runs a task server on a Unix socket for the load generator'''
+    # Archiving is turned off so every generated task stays readable by id
+    try:
+        asyncio.run(task_server.serve(text_storage(folder, archive_days=0), unix_path=socket_path))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+
+
+async def load_client(socket_path, client, latencies):
+    '''One client of the load generator. It logs in, adds a task of its
+        own, then sends a mix of reads and writes, timing every request
+    '''
+    reader, writer = await asyncio.open_unix_connection(socket_path)
+    rand = random.Random(client)
+
+    async def request(**fields):
+        start = time.perf_counter()
+        writer.write(json.dumps(fields).encode("utf-8") + b"\n")
+        response = json.loads(await reader.readline())
+        latencies.append(time.perf_counter() - start)
+        if not response['ok']:
+            raise RuntimeError(response['error'])
+        return response['result']
+
+    username = f"user{client}"
+    await request(op="login", username=username, password="password")
+    task = await request(op="add", username=username, title="Load test", description="Load test task",
+                         due_date="2030-01-01")
+    for n in range(LOAD_REQUESTS):
+        choice = rand.random()
+        if choice < 0.6:
+            await request(op="get", task_id=rand.randrange(1, LOAD_TASKS + 1))
+        elif choice < 0.8:
+            await request(op="mine")
+        elif choice < 0.9:
+            await request(op="due", task_id=task['id'], due_date=f"2030-01-{1 + n % 28:02d}")
+        else:
+            await request(op="add", username=username, title=f"Load test {n}", description="Load test task",
+                          due_date="2030-02-01")
+    writer.close()
+
+
+async def run_load(socket_path):
+    '''Runs every load generator client at once and returns the request
+        latencies in seconds
+    '''
+    latencies = []
+    await asyncio.gather(*(load_client(socket_path, client, latencies) for client in range(LOAD_CLIENTS)))
+    return latencies
+
+
+def bench_server():
+    '''Measures the throughput and latency of the task server with many
+        clients sending requests at once
+    '''
+    with tempfile.TemporaryDirectory() as folder:
+        api_storage(folder)
+        write_task_file(os.path.join(folder, "tasks.txt"), LOAD_TASKS)
+        socket_path = os.path.join(folder, "server.sock")
+        server = multiprocessing.Process(target=server_process, args=(folder, socket_path))
+        server.start()
+        try:
+            while not os.path.exists(socket_path):
+                time.sleep(0.01)
+            start = time.perf_counter()
+            latencies = asyncio.run(run_load(socket_path))
+            elapsed = time.perf_counter() - start
+        finally:
+            server.terminate()
+            server.join()
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[int(len(latencies) * 0.99)]
+    print(f"{LOAD_CLIENTS} clients sending {len(latencies)} requests to the task server"
+          f" (60% get, 20% mine, 10% due date edits, 10% adds):")
+    print(f"  throughput: {len(latencies) / elapsed:.0f} requests per second")
+    print(f"  latency:    p50 {p50 * 1000:.2f}ms, p99 {p99 * 1000:.2f}ms")
+
+
+def bench_logins():
+    '''Times password checks with the default hash: one login at a time,
+        many logins at once through the thread pool, and repeat logins in
+        the same session
+    '''
+    with tempfile.TemporaryDirectory() as folder:
+        with open(os.path.join(folder, "user.txt"), "w") as user_file:
+            user_file.write("\n".join(f"user{n};password{n}" for n in range(LOGIN_USERS)))
+        credentials = Credentials(text_storage(folder))
+        migrate_time = timed(credentials.migrate)
+        usernames = [f"user{n}" for n in range(LOGIN_USERS)]
+        # Each way of logging in starts with an empty session cache
+        serial_time = timed(lambda: [credentials.check(k, f"password{n}", {}) for n, k in enumerate(usernames)])
+
+        async def log_in_all(cache):
+            return await asyncio.gather(*(
+                credentials.check_async(k, f"password{n}", cache) for n, k in enumerate(usernames)))
+        cache = {}
+        pool_time = timed(asyncio.run, log_in_all(cache))
+        cached_time = timed(asyncio.run, log_in_all(cache))
+        check(all(asyncio.run(log_in_all(cache))), "a correct password was refused")
+        check(not credentials.check("user0", "wrong", {}), "a wrong password was accepted")
+    print(f"Logging in {LOGIN_USERS} users with {credentials.method} (cost {credentials.cost}):")
+    print(f"  migrating plain text passwords: {migrate_time:.3f}s")
+    print(f"  one at a time:        {LOGIN_USERS / serial_time:.0f} logins per second")
+    print(f"  at once (thread pool): {LOGIN_USERS / pool_time:.0f} logins per second"
+          f" ({os.cpu_count()} CPUs)")
+    print(f"  again in the session:  {LOGIN_USERS / cached_time:.0f} logins per second")
+
+
+# Benchmarks that can be run, by name
+BENCHMARKS = {
+    "dates": bench_dates,
+    "memory": bench_memory,
+    "columns": bench_columns,
+    "stress": bench_stress,
+    "sidecars": bench_sidecars,
+    "pages": bench_pages,
+    "mmap": bench_mmap,
+    "binary": bench_binary,
+    "escaping": bench_escaping,
+    "archive": bench_archive,
+    "render": bench_render,
+    "api": bench_api,
+    "bulk": bench_bulk,
+    "soak": bench_soak,
+    "server": bench_server,
+    "logins": bench_logins,
+}
+
+
+def main(names):
+    '''Runs the named benchmarks, or all of them if no names are given,
+        and returns the exit status: 1 if any check failed, otherwise 0
+    '''
+    failed = []
+    for name in names or BENCHMARKS:
+        if name not in BENCHMARKS:
+            print(f"Unknown benchmark '{name}'. Choose from: {', '.join(BENCHMARKS)}")
+            failed.append(name)
+            continue
+        print(f"\n==== {name} ====")
+        try:
+            BENCHMARKS[name]()
+        except CheckFailed as error:
+            print(f"  CHECK FAILED: {error}")
+            failed.append(name)
+    if failed:
+        print(f"\nFailed: {', '.join(failed)}")
+        return 1
+    return 0
+
+
+# Run the benchmarks named on the command line
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
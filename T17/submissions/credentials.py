@@ -0,0 +1,274 @@
+"""
+================================CREDENTIALS================================
+This module stores user passwords as salted hashes instead of plain text,
+and checks the passwords users log in with against them:
+- passwords are hashed with scrypt, a deliberately slow and memory hungry
+hash, or with PBKDF2 where scrypt is not available or PBKDF2 is chosen.
+The stored hash holds the method, cost and random salt it was made with:
+    scrypt$<n>$<r>$<p>$<salt>$<hash>
+    pbkdf2_sha256$<iterations>$<salt>$<hash>
+- the method and cost are chosen with the TASK_MANAGER_HASH ("scrypt" or
+"pbkdf2") and TASK_MANAGER_HASH_COST (scrypt n or PBKDF2 iterations)
+environment variables, and hashes made with another method or cost are
+replaced the next time their user logs in
+- hashing runs in a thread pool (hashlib releases the GIL while it
+hashes), so several logins are checked at once and the task server keeps
+answering other clients while a login is checked
+- a successful login is remembered for the rest of the session with a
+fast keyed digest, so logging in again does not hash the password again
+
+User files from before passwords were hashed hold "username;password"
+lines. Those passwords still work, and migrate() hashes all of them once,
+which can also be run from the command line:
+    python credentials.py [user file]
+"""
+
+# Import libraries
+import asyncio
+import hashlib
+import hmac
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+# Environment variables used to choose the hash method and its cost
+HASH_VARIABLE = "TASK_MANAGER_HASH"
+HASH_COST_VARIABLE = "TASK_MANAGER_HASH_COST"
+
+# Default costs: scrypt n (with block size r and parallelism p), and the
+# number of PBKDF2 iterations
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+PBKDF2_ITERATIONS = 600000
+
+# Bytes of random salt and of hash output
+SALT_SIZE = 16
+HASH_SIZE = 32
+
+# scrypt is only available when Python is built against OpenSSL 1.1 or later
+SCRYPT_AVAILABLE = hasattr(hashlib, "scrypt")
+
+# Threads hashing passwords, only created once the first password is hashed
+_pool = None
+
+
+def hash_pool():
+    '''Returns the thread pool shared by every password hash'''
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="credentials")
+    return _pool
+
+
+def _forget_pool():
+    '''Drops the thread pool in a forked child process, whose copy of the
+        pool has none of the parent's threads to run the hashes
+    '''
+    global _pool
+    _pool = None
+
+
+# os.register_at_fork is only available on Unix systems
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_pool)
+
+
+def default_method():
+    '''Returns the hash method chosen by the TASK_MANAGER_HASH environment
+        variable, using PBKDF2 if scrypt is not available
+    '''
+    method = os.environ.get(HASH_VARIABLE, "scrypt")
+    if method not in ("scrypt", "pbkdf2"):
+        raise ValueError(f"Unknown password hash '{method}', use 'scrypt' or 'pbkdf2'")
+    if method == "scrypt" and not SCRYPT_AVAILABLE:
+        return "pbkdf2"
+    return method
+
+
+def method_cost(method):
+    '''Returns the default cost of a hash method'''
+    return SCRYPT_N if method == "scrypt" else PBKDF2_ITERATIONS
+
+
+def default_cost(method):
+    '''Returns the cost chosen by the TASK_MANAGER_HASH_COST environment
+        variable, or the default cost of the hash method. A scrypt cost
+        must be a power of two above 1, and a PBKDF2 cost 1 or more.
+    '''
+    cost = os.environ.get(HASH_COST_VARIABLE)
+    if cost is None:
+        return method_cost(method)
+    try:
+        cost = int(cost)
+    except ValueError:
+        raise ValueError(f"{HASH_COST_VARIABLE} must be a whole number, not '{cost}'") from None
+    if method == "scrypt" and (cost < 2 or cost & (cost - 1)):
+        raise ValueError(f"{HASH_COST_VARIABLE} must be a power of two above 1 for scrypt, "
+                         f"such as {SCRYPT_N}, not {cost}")
+    if cost < 1:
+        raise ValueError(f"{HASH_COST_VARIABLE} must be 1 or more for pbkdf2, not {cost}")
+    return cost
+
+
+def hash_password(password, method="scrypt", cost=None, salt=None):
+    '''Hashes a password with a new random salt, returning the text stored
+        for the user. The cost defaults to that of the hash method.
+    '''
+    cost = cost or method_cost(method)
+    salt = salt or os.urandom(SALT_SIZE)
+    if method == "scrypt":
+        digest = _scrypt(password, salt, cost, SCRYPT_R, SCRYPT_P)
+        return f"scrypt${cost}${SCRYPT_R}${SCRYPT_P}${salt.hex()}${digest.hex()}"
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, cost, HASH_SIZE)
+    return f"pbkdf2_sha256${cost}${salt.hex()}${digest.hex()}"
+
+
+def _scrypt(password, salt, n, r, p):
+    '''Runs scrypt with enough memory allowed for its cost'''
+    return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r * p + 2 ** 20, dklen=HASH_SIZE)
+
+
+def is_hashed(stored):
+    '''Returns True if a stored password is a hash rather than plain text'''
+    parts = stored.split("$")
+    return ((parts[0] == "scrypt" and len(parts) == 6)
+            or (parts[0] == "pbkdf2_sha256" and len(parts) == 4))
+
+
+def verify_password(password, stored):
+    '''Returns True if a password matches the stored hash, or the stored
+        plain text password of a user that has not been migrated yet
+    '''
+    if not is_hashed(stored):
+        return hmac.compare_digest(password.encode("utf-8"), stored.encode("utf-8"))
+    parts = stored.split("$")
+    if parts[0] == "scrypt":
+        n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+        digest = _scrypt(password, bytes.fromhex(parts[4]), n, r, p)
+    else:
+        digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), bytes.fromhex(parts[2]),
+                                     int(parts[1]), HASH_SIZE)
+    return hmac.compare_digest(digest, bytes.fromhex(parts[-1]))
+
+
+class Credentials:
+    '''Checks and stores the passwords of a storage backend's users (see
+        storage.py), hashing in the shared thread pool
+    '''
+
+    def __init__(self, storage, method=None, cost=None):
+        self.storage = storage
+        self.method = method or default_method()
+        self.cost = cost or default_cost(self.method)
+        # Secret key of the digests remembering successful logins, which
+        # never leaves this process
+        self.cache_key = os.urandom(32)
+        # Logins remembered when no session cache is passed in
+        self.verified = {}
+
+    def hash(self, password):
+        '''Hashes a password with the chosen method and cost'''
+        return hash_password(password, self.method, self.cost)
+
+    async def hash_async(self, password):
+        '''Hashes a password in the thread pool without blocking the event loop'''
+        return await asyncio.wrap_future(hash_pool().submit(self.hash, password))
+
+    def add_user(self, username, password):
+        '''Adds a new user with a hashed password'''
+        self.storage.add_user(username, self.hash(password))
+
+    def check(self, username, password, cache=None):
+        '''Returns True if the password is right for the user. Hashing runs
+            in the thread pool, and an outdated or plain text stored
+            password is replaced with a new hash.
+        '''
+        stored = self.storage.password(username)
+        if stored is None:
+            return False
+        if self._cached(username, password, stored, cache):
+            return True
+        valid, new_stored = hash_pool().submit(self._verify, password, stored).result()
+        return self._finish(username, password, stored, valid, new_stored, cache)
+
+    async def check_async(self, username, password, cache=None, write=None):
+        '''Returns True if the password is right for the user, hashing in the
+            thread pool without blocking the event loop. If write is given (see
+            TaskServer.write), any new hash is saved through it.
+        '''
+        stored = self.storage.password(username)
+        if stored is None:
+            return False
+        if self._cached(username, password, stored, cache):
+            return True
+        valid, new_stored = await asyncio.wrap_future(
+            hash_pool().submit(self._verify, password, stored))
+        if valid and new_stored is not None and write is not None:
+            await write(lambda: self.storage.set_passwords({username: new_stored}))
+            stored, new_stored = new_stored, None
+        return self._finish(username, password, stored, valid, new_stored, cache)
+
+    def needs_rehash(self, stored):
+        '''Returns True if a stored password is plain text or was hashed with
+            another method or cost
+        '''
+        if not is_hashed(stored):
+            return True
+        parts = stored.split("$")
+        if self.method == "scrypt":
+            return parts[0] != "scrypt" or int(parts[1]) != self.cost
+        return parts[0] != "pbkdf2_sha256" or int(parts[1]) != self.cost
+
+    def migrate(self):
+        '''Hashes every plain text password in one write, hashing them in
+            the thread pool at the same time, and returns how many there were
+        '''
+        username_password = self.storage.users()
+        plain = {k: v for k, v in username_password.items() if not is_hashed(v)}
+        if plain:
+            hashes = hash_pool().map(self.hash, plain.values())
+            self.storage.set_passwords(dict(zip(plain, hashes)))
+        return len(plain)
+
+    def _digest(self, password):
+        '''Returns the keyed digest used to remember a successful login'''
+        return hmac.new(self.cache_key, password.encode("utf-8"), hashlib.sha256).digest()
+
+    def _cached(self, username, password, stored, cache):
+        '''Returns True if this password was already verified against the
+            same stored hash in this session
+        '''
+        cache = self.verified if cache is None else cache
+        remembered = cache.get(username)
+        return (remembered is not None and remembered[0] == stored
+                and hmac.compare_digest(remembered[1], self._digest(password)))
+
+    def _verify(self, password, stored):
+        '''Checks a password and makes a new hash if the stored one is out of
+            date, run in the thread pool
+        '''
+        valid = verify_password(password, stored)
+        new_stored = self.hash(password) if valid and self.needs_rehash(stored) else None
+        return valid, new_stored
+
+    def _finish(self, username, password, stored, valid, new_stored, cache):
+        '''Saves any new hash and remembers a successful login'''
+        if not valid:
+            return False
+        if new_stored is not None:
+            self.storage.set_passwords({username: new_stored})
+            stored = new_stored
+        cache = self.verified if cache is None else cache
+        cache[username] = (stored, self._digest(password))
+        return True
+
+
+# Hash the plain text passwords of the user file named on the command line
+if __name__ == "__main__":
+    from storage import TextBackend
+    from user_store import UserStore, USER_FILE
+    user_path = sys.argv[1] if len(sys.argv) > 1 else USER_FILE
+    count = Credentials(TextBackend(user_store=UserStore(user_path))).migrate()
+    print(f"Hashed {count} plain text password(s) in {user_path}")
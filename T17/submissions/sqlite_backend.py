@@ -0,0 +1,327 @@
+"""
+===============================SQLITE BACKEND===============================
+This module stores the Task Manager tasks and users in a SQLite database
+instead of text files (see storage.py for how the backend is chosen):
+- tasks are rows of the tasks table, with dates stored as day ordinals,
+indexed by username and by completion and due date, so a user's tasks and
+the overdue tasks are index lookups rather than a scan of every task
+- each edit is a single row UPDATE, and the database runs in WAL mode so
+other sessions can keep reading while one session writes
+- users are rows of the users table, kept in the order they were added
+
+Run this file to import the existing tasks.txt and user.txt files into the
+database once:
+    python sqlite_backend.py [database file]
+"""
+
+# Import libraries
+import itertools
+import sqlite3
+import sys
+from storage import StorageBackend, DATABASE_FILE, DEFAULT_USERNAME, DEFAULT_PASSWORD
+from task_pager import PAGE_SIZE
+from task_record import Task
+from task_store import TaskStore, TaskConflictError, TASK_FILE
+from user_store import UserStore, USER_FILE
+
+# Seconds to wait for another session's write to finish
+BUSY_TIMEOUT = 30
+
+# Statements that create the tables and indexes if they do not exist
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL,
+    due INTEGER NOT NULL,
+    assigned INTEGER NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS tasks_by_user ON tasks (username, completed, due);
+CREATE INDEX IF NOT EXISTS tasks_by_due ON tasks (completed, due);
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL
+);
+"""
+
+# Columns of the tasks table in the order of the Task fields
+TASK_COLUMNS = "id, username, title, description, due, assigned, completed"
+
+
+def row_to_task(row):
+    '''Creates a Task from a row of the tasks table'''
+    task_id, username, title, description, due, assigned, completed = row
+    return Task(task_id, username, title, description, due, assigned, bool(completed))
+
+
+class SqliteStats:
+    '''Task statistics answered by indexed queries, with the same methods as
+        TaskStats in task_stats.py
+    '''
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def totals(self, today_ordinal):
+        '''Returns the total, complete and overdue counts across all users'''
+        count_tasks, count_complete = self.connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(completed), 0) FROM tasks").fetchone()
+        count_overdue, = self.connection.execute(
+            "SELECT COUNT(*) FROM tasks WHERE completed = 0 AND due <= ?", (today_ordinal,)).fetchone()
+        return count_tasks, count_complete, count_overdue
+
+    def user_counts(self, username, today_ordinal):
+        '''Returns the [total, complete, incomplete, overdue] counts of a user'''
+        total, complete = self.connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(completed), 0) FROM tasks WHERE username = ?",
+            (username,)).fetchone()
+        overdue, = self.connection.execute(
+            "SELECT COUNT(*) FROM tasks WHERE username = ? AND completed = 0 AND due <= ?",
+            (username, today_ordinal)).fetchone()
+        return [total, complete, total - complete, overdue]
+
+
+class SqlitePager:
+    '''Pages of tasks read with the task id index, with the same methods as
+        TaskPager in task_pager.py
+    '''
+
+    def __init__(self, connection, page_size=PAGE_SIZE):
+        self.connection = connection
+        self.page_size = page_size
+
+    def __len__(self):
+        count_tasks, = self.connection.execute("SELECT COUNT(*) FROM tasks").fetchone()
+        return count_tasks
+
+    def page_count(self):
+        '''Returns the number of pages, which is at least one'''
+        return max(1, -(-len(self) // self.page_size))
+
+    def page(self, number):
+        '''Returns the tasks on a page, numbered from 1'''
+        cursor = self.connection.execute(
+            f"SELECT {TASK_COLUMNS} FROM tasks ORDER BY id LIMIT ? OFFSET ?",
+            (self.page_size, (number - 1) * self.page_size))
+        return [row_to_task(row) for row in cursor]
+
+    def page_of(self, task_id):
+        '''Returns the number of the page showing a task, or None'''
+        if self.connection.execute("SELECT 1 FROM tasks WHERE id = ?", (task_id,)).fetchone() is None:
+            return None
+        row, = self.connection.execute("SELECT COUNT(*) FROM tasks WHERE id < ?", (task_id,)).fetchone()
+        return row // self.page_size + 1
+
+
+class SqliteBackend(StorageBackend):
+    '''Stores tasks and users in a SQLite database'''
+
+    def __init__(self, db_path=DATABASE_FILE):
+        self.db_path = db_path
+        # Autocommit mode, so every statement outside a with block commits
+        self.connection = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def initialise(self):
+        # Add the default admin account to an empty database
+        if self.connection.execute("SELECT 1 FROM users LIMIT 1").fetchone() is None:
+            self.add_user(DEFAULT_USERNAME, DEFAULT_PASSWORD)
+
+    def tasks(self):
+        return list(self.iter_tasks())
+
+    def iter_tasks(self):
+        cursor = self.connection.execute(f"SELECT {TASK_COLUMNS} FROM tasks ORDER BY id")
+        for row in cursor:
+            yield row_to_task(row)
+
+    def task_range(self, start, stop):
+        cursor = self.connection.execute(
+            f"SELECT {TASK_COLUMNS} FROM tasks ORDER BY id LIMIT ? OFFSET ?",
+            (max(stop - start, 0), start))
+        return [row_to_task(row) for row in cursor]
+
+    def tasks_for_user(self, username):
+        cursor = self.connection.execute(
+            f"SELECT {TASK_COLUMNS} FROM tasks WHERE username = ? ORDER BY id", (username,))
+        return [row_to_task(row) for row in cursor]
+
+    def overdue_tasks(self, today_ordinal):
+        return self._incomplete_due(1, today_ordinal)
+
+    def tasks_due_within(self, days, today_ordinal):
+        return self._incomplete_due(today_ordinal + 1, today_ordinal + days)
+
+    def get(self, task_id):
+        row = self.connection.execute(
+            f"SELECT {TASK_COLUMNS} FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        return None if row is None else row_to_task(row)
+
+    def pager(self, page_size=PAGE_SIZE):
+        return SqlitePager(self.connection, page_size)
+
+    def add(self, username, title, description, due_date, assigned_date, completed=False):
+        cursor = self.connection.execute(
+            "INSERT INTO tasks (username, title, description, due, assigned, completed) VALUES (?, ?, ?, ?, ?, ?)",
+            (username, title, description, due_date.toordinal(), assigned_date.toordinal(), completed))
+        return self.get(cursor.lastrowid)
+
+    def add_many(self, rows):
+        # Insert the whole batch in one transaction
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            first_id = self.connection.execute(
+                "SELECT COALESCE(MAX(seq), 0) + 1 FROM sqlite_sequence WHERE name = 'tasks'").fetchone()[0]
+            self.connection.executemany(
+                "INSERT INTO tasks (username, title, description, due, assigned, completed) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                ((username, title, description, due_date.toordinal(), assigned_date.toordinal(), completed)
+                 for username, title, description, due_date, assigned_date, completed in rows))
+            cursor = self.connection.execute(
+                f"SELECT {TASK_COLUMNS} FROM tasks WHERE id >= ? ORDER BY id", (first_id,))
+            return [row_to_task(row) for row in cursor]
+
+    def set_completed(self, task_id, completed=True, expected=None):
+        return self._update(task_id, "completed", completed, expected)
+
+    def set_completed_many(self, task_ids, completed=True):
+        task_ids = list(dict.fromkeys(task_ids))
+        # Change every task in one transaction, undone if any is missing
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            for task_id in task_ids:
+                cursor = self.connection.execute(
+                    "UPDATE tasks SET completed = ? WHERE id = ?", (completed, task_id))
+                if cursor.rowcount == 0:
+                    raise ValueError(f"Task {task_id} does not exist")
+        return [self.get(task_id) for task_id in task_ids]
+
+    def set_due_date(self, task_id, due_date, expected=None):
+        return self._update(task_id, "due", due_date.toordinal(), expected)
+
+    def reassign(self, task_id, username, expected=None):
+        return self._update(task_id, "username", username, expected)
+
+    def reassign_all(self, from_username, to_username):
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            task_ids = [row[0] for row in self.connection.execute(
+                "SELECT id FROM tasks WHERE username = ? ORDER BY id", (from_username,))]
+            self.connection.execute(
+                "UPDATE tasks SET username = ? WHERE username = ?", (to_username, from_username))
+        return [self.get(task_id) for task_id in task_ids]
+
+    def replace_all(self, tasks):
+        # Replace every row in a single transaction
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            self.connection.execute("DELETE FROM tasks")
+            self._insert_tasks(tasks)
+
+    def compact(self):
+        # Move the write-ahead log back into the database file
+        self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def get_stats(self):
+        return SqliteStats(self.connection)
+
+    def report_counts(self, today_ordinal):
+        # Count every user's tasks in one pass of the username index
+        user_counts = {}
+        count_tasks = 0
+        cursor = self.connection.execute(
+            "SELECT username, COUNT(*), SUM(completed), SUM(completed = 0 AND due <= ?) "
+            "FROM tasks GROUP BY username", (today_ordinal,))
+        for username, total, complete, overdue in cursor:
+            user_counts[username] = [total, complete, total - complete, overdue]
+            count_tasks += total
+        return count_tasks, user_counts
+
+    def users(self):
+        cursor = self.connection.execute("SELECT username, password FROM users ORDER BY rowid")
+        return dict(cursor.fetchall())
+
+    def has_user(self, username):
+        return self.password(username) is not None
+
+    def password(self, username):
+        row = self.connection.execute(
+            "SELECT password FROM users WHERE username = ?", (username,)).fetchone()
+        return None if row is None else row[0]
+
+    def add_user(self, username, password):
+        self.connection.execute(
+            "INSERT INTO users (username, password) VALUES (?, ?)", (username, password))
+
+    def set_passwords(self, username_password):
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            self.connection.executemany(
+                "UPDATE users SET password = ? WHERE username = ?",
+                [(password, username) for username, password in username_password.items()])
+
+    def _incomplete_due(self, first_ordinal, last_ordinal):
+        '''Returns the incomplete tasks due between two date ordinals, found
+            with the completion and due date index
+        '''
+        cursor = self.connection.execute(
+            f"SELECT {TASK_COLUMNS} FROM tasks WHERE completed = 0 AND due BETWEEN ? AND ? "
+            f"ORDER BY due, id", (first_ordinal, last_ordinal))
+        return [row_to_task(row) for row in cursor]
+
+    def _insert_tasks(self, tasks):
+        '''Inserts tasks keeping their ids, replacing any with the same id'''
+        self.connection.executemany(
+            f"INSERT OR REPLACE INTO tasks ({TASK_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (task.fields() for task in tasks))
+
+    def _update(self, task_id, column, value, expected):
+        '''Changes one column of a task in a single UPDATE. With expected
+            task fields the row is only changed if it still has them all,
+            and without them a ValueError is raised if there is no such row.
+        '''
+        if expected is None:
+            cursor = self.connection.execute(
+                f"UPDATE tasks SET {column} = ? WHERE id = ?", (value, task_id))
+            if cursor.rowcount == 0:
+                raise ValueError(f"Task {task_id} does not exist")
+        else:
+            cursor = self.connection.execute(
+                f"UPDATE tasks SET {column} = ? WHERE id = ? AND username = ? AND title = ? "
+                f"AND description = ? AND due = ? AND assigned = ? AND completed = ?",
+                (value, *expected))
+            if cursor.rowcount == 0:
+                raise TaskConflictError(f"Task {task_id} was changed by another session")
+        return self.get(task_id)
+
+
+def import_text_files(db_path=DATABASE_FILE, task_path=TASK_FILE, user_path=USER_FILE,
+                      log_path=None):
+    '''Copies every task and user from the text files into a SQLite database,
+        keeping task ids and user order, and returns how many of each
+    '''
+    backend = SqliteBackend(db_path)
+    # Archived tasks are imported too, as the database has no archive
+    task_store = TaskStore(task_path, log_path)
+    tasks = itertools.chain(task_store.archive.iter_tasks(), task_store.iter_tasks())
+    username_password = UserStore(user_path).users()
+    connection = backend.connection
+    # Import everything in a single transaction
+    with connection:
+        connection.execute("BEGIN IMMEDIATE")
+        backend._insert_tasks(tasks)
+        connection.executemany(
+            "INSERT OR REPLACE INTO users (username, password) VALUES (?, ?)", username_password.items())
+    count_tasks, = connection.execute("SELECT COUNT(*) FROM tasks").fetchone()
+    return count_tasks, len(username_password)
+
+
+# Import the text files into the database named on the command line
+if __name__ == "__main__":
+    db_path = sys.argv[1] if len(sys.argv) > 1 else DATABASE_FILE
+    count_tasks, count_users = import_text_files(db_path)
+    print(f"Imported {count_tasks} tasks and {count_users} users into {db_path}")
@@ -0,0 +1,297 @@
+"""
+==================================STORAGE==================================
+This module defines the storage backend interface used by the Task Manager
+to read and save tasks and users, so the program does not depend on how
+they are stored. Two backends are available:
+- text:   tasks.txt/tasks.log and user.txt (see task_store.py and
+          user_store.py), the default
+- sqlite: a single SQLite database with indexed tables (see
+          sqlite_backend.py)
+
+The backend is chosen with the TASK_MANAGER_STORAGE environment variable
+("text" or "sqlite"), and the SQLite database file with TASK_MANAGER_DB.
+"""
+
+# Import libraries
+import os
+from abc import ABC, abstractmethod
+from task_pager import TaskPager, PAGE_SIZE
+from task_store import TaskStore
+from user_store import UserStore
+
+# Environment variables used to choose the storage backend
+STORAGE_VARIABLE = "TASK_MANAGER_STORAGE"
+DATABASE_VARIABLE = "TASK_MANAGER_DB"
+
+# Default SQLite database file
+DATABASE_FILE = "tasks.db"
+
+# Account created when there are no users yet
+DEFAULT_USERNAME = "admin"
+DEFAULT_PASSWORD = "password"
+
+
+class StorageBackend(ABC):
+    '''Interface every storage backend provides. Tasks are Task objects (see
+        task_record.py) and users are usernames with their passwords. The
+        methods that change a task accept the task fields the caller read as
+        expected, and raise TaskConflictError if the task has changed since.
+        A backend missing any of the methods cannot be created.
+    '''
+
+    @abstractmethod
+    def initialise(self):
+        '''Creates empty storage with the default admin account if needed'''
+
+    def load(self):
+        '''Reads the tasks into memory ahead of the first request, for a
+            backend that keeps them there. Other backends do nothing.
+        '''
+
+    @abstractmethod
+    def tasks(self):
+        '''Returns a list of every task in task id order'''
+
+    @abstractmethod
+    def iter_tasks(self):
+        '''Yields every task in task id order'''
+
+    @abstractmethod
+    def task_range(self, start, stop):
+        '''Returns the tasks from position start up to (not including)
+            position stop in task id order
+        '''
+
+    @abstractmethod
+    def tasks_for_user(self, username):
+        '''Returns the tasks assigned to a user in task id order'''
+
+    @abstractmethod
+    def overdue_tasks(self, today_ordinal):
+        '''Returns the incomplete tasks due today or earlier in due date order'''
+
+    @abstractmethod
+    def tasks_due_within(self, days, today_ordinal):
+        '''Returns the incomplete tasks due after today and within the given
+            number of days, in due date order
+        '''
+
+    @abstractmethod
+    def get(self, task_id):
+        '''Returns the task with the given id, or None'''
+
+    @abstractmethod
+    def pager(self, page_size=PAGE_SIZE):
+        '''Returns a pager of every task in task id order, providing
+            page_count(), page(number) and page_of(task_id) as in task_pager.py
+        '''
+
+    @abstractmethod
+    def add(self, username, title, description, due_date, assigned_date, completed=False):
+        '''Adds a new task and returns it'''
+
+    @abstractmethod
+    def add_many(self, rows):
+        '''Adds a batch of tasks from (username, title, description,
+            due_date, assigned_date, completed) rows in a single write and
+            returns them
+        '''
+
+    @abstractmethod
+    def set_completed(self, task_id, completed=True, expected=None):
+        '''Changes the completion status of a task and returns it, raising
+            a ValueError if the task does not exist
+        '''
+
+    @abstractmethod
+    def set_completed_many(self, task_ids, completed=True):
+        '''Changes the completion status of a batch of tasks in a single
+            write and returns them, raising a ValueError without changing
+            anything if a task does not exist
+        '''
+
+    @abstractmethod
+    def set_due_date(self, task_id, due_date, expected=None):
+        '''Changes the due date of a task and returns it, raising a
+            ValueError if the task does not exist
+        '''
+
+    @abstractmethod
+    def reassign(self, task_id, username, expected=None):
+        '''Changes the user assigned to a task and returns it, raising a
+            ValueError if the task does not exist
+        '''
+
+    @abstractmethod
+    def reassign_all(self, from_username, to_username):
+        '''Assigns every task of one user to another user in a single write
+            and returns the changed tasks
+        '''
+
+    @abstractmethod
+    def replace_all(self, tasks):
+        '''Replaces every stored task with the given tasks'''
+
+    @abstractmethod
+    def compact(self):
+        '''Tidies the stored tasks up, called when the program exits'''
+
+    @abstractmethod
+    def get_stats(self):
+        '''Returns task statistics providing totals(today_ordinal) and
+            user_counts(username, today_ordinal), as in task_stats.py
+        '''
+
+    @abstractmethod
+    def report_counts(self, today_ordinal):
+        '''Returns the total number of tasks and a dictionary of username to
+            [total, complete, incomplete, overdue] counts for the reports
+        '''
+
+    @abstractmethod
+    def users(self):
+        '''Returns a dictionary of usernames and passwords in the order the
+            users were added
+        '''
+
+    @abstractmethod
+    def has_user(self, username):
+        '''Returns True if the user exists'''
+
+    @abstractmethod
+    def password(self, username):
+        '''Returns the stored password of a user, or None'''
+
+    @abstractmethod
+    def add_user(self, username, password):
+        '''Adds a new user'''
+
+    @abstractmethod
+    def set_passwords(self, username_password):
+        '''Replaces the stored passwords of existing users from a
+            dictionary of usernames and passwords
+        '''
+
+
+class TextBackend(StorageBackend):
+    '''Stores tasks in tasks.txt and tasks.log and users in user.txt'''
+
+    def __init__(self, task_store=None, user_store=None):
+        self.task_store = task_store or TaskStore()
+        self.user_store = user_store or UserStore()
+        # Pager kept between views so its line offset index is reused
+        self.task_pager = None
+
+    def initialise(self):
+        # Create the user file with a default account if it does not exist
+        if not os.path.exists(self.user_store.user_path):
+            with open(self.user_store.user_path, "w") as user_file:
+                user_file.write(f"{DEFAULT_USERNAME};{DEFAULT_PASSWORD}")
+        # Create the task file if it does not exist
+        if not os.path.exists(self.task_store.task_path):
+            with open(self.task_store.task_path, "w"):
+                pass
+
+    def load(self):
+        self.task_store.load()
+
+    def tasks(self):
+        return self.task_store.refresh().tasks
+
+    def iter_tasks(self):
+        return self.task_store.iter_tasks()
+
+    def task_range(self, start, stop):
+        # Slice the in-memory task list, which is kept in task id order
+        return self.task_store.refresh().tasks[start:stop]
+
+    def tasks_for_user(self, username):
+        return self.task_store.tasks_for_user(username)
+
+    def overdue_tasks(self, today_ordinal):
+        return self.task_store.overdue_tasks(today_ordinal)
+
+    def tasks_due_within(self, days, today_ordinal):
+        return self.task_store.tasks_due_within(days, today_ordinal)
+
+    def get(self, task_id):
+        return self.task_store.get(task_id)
+
+    def pager(self, page_size=PAGE_SIZE):
+        if self.task_pager is None:
+            self.task_pager = TaskPager(self.task_store)
+        self.task_pager.page_size = page_size
+        return self.task_pager
+
+    def add(self, username, title, description, due_date, assigned_date, completed=False):
+        return self.task_store.add(username, title, description, due_date, assigned_date, completed)
+
+    def add_many(self, rows):
+        return self.task_store.add_many(rows)
+
+    def set_completed(self, task_id, completed=True, expected=None):
+        return self.task_store.set_completed(task_id, completed, expected)
+
+    def set_completed_many(self, task_ids, completed=True):
+        return self.task_store.set_completed_many(task_ids, completed)
+
+    def set_due_date(self, task_id, due_date, expected=None):
+        return self.task_store.set_due_date(task_id, due_date, expected)
+
+    def reassign(self, task_id, username, expected=None):
+        return self.task_store.reassign(task_id, username, expected)
+
+    def reassign_all(self, from_username, to_username):
+        return self.task_store.reassign_all(from_username, to_username)
+
+    def replace_all(self, tasks):
+        self.task_store.replace_all(tasks)
+
+    def compact(self):
+        self.task_store.compact()
+
+    def get_stats(self):
+        return self.task_store.get_stats()
+
+    def report_counts(self, today_ordinal):
+        # Count over the username, due date and completion columns, which
+        # the task store keeps up to date as tasks change
+        columns = self.task_store.get_columns()
+        user_counts = columns.user_counts(today_ordinal)
+        # Archived tasks are all complete, and counted from the archive
+        # aggregates without opening any archive segments
+        user_archived = self.task_store.archive.user_counts()
+        for username, count in user_archived.items():
+            counts = user_counts.setdefault(username, [0, 0, 0, 0])
+            counts[0] += count
+            counts[1] += count
+        return len(columns) + sum(user_archived.values()), user_counts
+
+    def users(self):
+        return self.user_store.users()
+
+    def has_user(self, username):
+        return username in self.user_store
+
+    def password(self, username):
+        return self.user_store.password(username)
+
+    def add_user(self, username, password):
+        self.user_store.add_user(username, password)
+
+    def set_passwords(self, username_password):
+        self.user_store.set_passwords(username_password)
+
+
+def get_backend(name=None):
+    '''Creates the named storage backend, by default the one chosen by the
+        TASK_MANAGER_STORAGE environment variable
+    '''
+    name = name or os.environ.get(STORAGE_VARIABLE, "text")
+    if name == "text":
+        return TextBackend()
+    if name == "sqlite":
+        # Only import sqlite3 when the SQLite backend is used
+        from sqlite_backend import SqliteBackend
+        return SqliteBackend(os.environ.get(DATABASE_VARIABLE, DATABASE_FILE))
+    raise ValueError(f"Unknown storage backend '{name}', use 'text' or 'sqlite'")
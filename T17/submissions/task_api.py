@@ -0,0 +1,384 @@
+"""
+==================================TASK API==================================
+This module lets scripts run Task Manager operations directly, without the
+input() prompts of the interactive menus:
+    import task_api
+    task = task_api.add_task("admin", "Title", "Description", "2030-01-01")
+    task_api.complete_task(task.id)
+
+Every function works on the storage backend chosen by the
+TASK_MANAGER_STORAGE environment variable (see storage.py), or on the
+backend passed as storage. Invalid input, such as an unknown user or
+task, raises a ValueError with the same message the menus would show.
+
+Batches of tasks can be imported from a file, and many tasks completed or
+reassigned at once. The users are checked once for the whole batch, every
+row is checked before anything is saved, and the task files are written
+once per batch rather than once per task. Import files can be:
+- csv:   a header row naming the username, title, description and
+         due_date columns, and optionally assigned_date and completed
+- jsonl: one JSON object per line with the same keys
+- txt:   semicolon separated lines of
+         username;title;description;due_date[;assigned_date[;Yes/No]]
+         (task lines copied from tasks.txt, with their id first, also work)
+
+The same operations can be run from the command line:
+    python task_api.py add <username> <title> <description> <YYYY-MM-DD>
+    python task_api.py complete <task id> [<task id> ...]
+    python task_api.py reassign <task id> <username>
+    python task_api.py reassign-all <from username> <to username>
+    python task_api.py due <task id> <YYYY-MM-DD>
+    python task_api.py import <file> [--format csv|jsonl|txt]
+    python task_api.py report
+"""
+
+# Import libraries
+import argparse
+import csv
+import json
+import os
+import sys
+from datetime import date
+from storage import get_backend
+from task_record import parse_date, split_fields, TASK_FILE_HEADER
+from task_store import TaskConflictError
+
+# Files written by the report function
+TASK_OVERVIEW_FILE = "task_overview.txt"
+USER_OVERVIEW_FILE = "user_overview.txt"
+
+# Import file formats, by file extension
+IMPORT_FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".txt": "txt"}
+
+# Number of invalid rows listed in the error raised by import_tasks
+IMPORT_ERROR_LIMIT = 5
+
+# Backend used when no storage is passed, only created once it is needed
+_storage = None
+
+
+def default_storage():
+    '''Returns the storage backend shared by calls made without storage'''
+    global _storage
+    if _storage is None:
+        _storage = get_backend()
+        _storage.initialise()
+    return _storage
+
+
+def to_date(value):
+    '''Accepts a date, a datetime or a YYYY-MM-DD date string'''
+    if isinstance(value, date):
+        return value
+    try:
+        return parse_date(value)
+    # Strings in the wrong format, and values that are not strings at all
+    except (ValueError, TypeError):
+        raise ValueError(f"Invalid date '{value}'. Please use the format YYYY-MM-DD") from None
+
+
+def text_field(record, name):
+    '''Returns a text field of an import record, which must be a string'''
+    value = record[name]
+    if not isinstance(value, str):
+        raise ValueError(f"{name} must be text")
+    return value
+
+
+def add_task(username, title, description, due_date, assigned_date=None, storage=None):
+    '''Adds a task assigned to an existing user and returns it. The
+        assigned date defaults to today.
+    '''
+    storage = storage or default_storage()
+    if not storage.has_user(username):
+        raise ValueError(f"User '{username}' does not exist")
+    due_date = to_date(due_date)
+    assigned_date = date.today() if assigned_date is None else to_date(assigned_date)
+    return storage.add(username, title, description, due_date, assigned_date)
+
+
+def import_tasks(path, file_format=None, storage=None):
+    '''Adds every task in a csv, jsonl or txt file (chosen by the file
+        extension unless file_format is given) in a single batch, and
+        returns the new tasks. Nothing is added if any row is invalid.
+    '''
+    storage = storage or default_storage()
+    if file_format is None:
+        file_format = IMPORT_FORMATS.get(os.path.splitext(path)[1].lower(), "txt")
+    # Read the users once for the whole batch
+    username_password = storage.users()
+    today = date.today()
+    rows = []
+    errors = []
+    for line_number, record in read_import_file(path, file_format):
+        try:
+            if not isinstance(record, dict):
+                raise ValueError("not a JSON object")
+            username = text_field(record, 'username')
+            if username not in username_password:
+                raise ValueError(f"User '{username}' does not exist")
+            assigned_date = record.get('assigned_date')
+            rows.append((
+                username,
+                text_field(record, 'title'),
+                text_field(record, 'description'),
+                to_date(record['due_date']),
+                today if assigned_date in (None, "") else to_date(assigned_date),
+                str(record.get('completed', "No")).lower() in ("yes", "true", "1")
+            ))
+        except KeyError as error:
+            errors.append(f"line {line_number}: missing {error.args[0]}")
+        except ValueError as error:
+            errors.append(f"line {line_number}: {error}")
+    if errors:
+        raise ValueError(f"{len(errors)} invalid row(s) in {path}, nothing imported: "
+                         + "; ".join(errors[:IMPORT_ERROR_LIMIT]))
+    return storage.add_many(rows)
+
+
+def read_import_file(path, file_format):
+    '''Yields the line number and a dictionary of the fields of each task
+        in an import file
+    '''
+    if file_format == "csv":
+        with open(path, newline="") as import_file:
+            reader = csv.DictReader(import_file)
+            for record in reader:
+                yield reader.line_num, record
+    elif file_format == "jsonl":
+        with open(path) as import_file:
+            for line_number, line in enumerate(import_file, 1):
+                if line.strip() != "":
+                    # Lines that are not JSON objects are reported by the caller
+                    try:
+                        yield line_number, json.loads(line)
+                    except json.JSONDecodeError:
+                        yield line_number, None
+    elif file_format == "txt":
+        fields = ['username', 'title', 'description', 'due_date', 'assigned_date', 'completed']
+        with open(path) as import_file:
+            escaped = False
+            for line_number, line in enumerate(import_file, 1):
+                line = line.rstrip("\n")
+                # Files copied from tasks.txt may be in the escaped format
+                if line == TASK_FILE_HEADER and line_number == 1:
+                    escaped = True
+                elif line != "":
+                    values = split_fields(line, escaped)
+                    # Task lines from tasks.txt start with their old task id
+                    if len(values) == 7:
+                        values.pop(0)
+                    yield line_number, dict(zip(fields, values))
+    else:
+        raise ValueError(f"Unknown import format '{file_format}', use csv, jsonl or txt")
+
+
+def complete_task(task_id, storage=None, expected=None):
+    '''Marks a task as complete and returns it'''
+    storage = storage or default_storage()
+    existing_task(storage, task_id)
+    return storage.set_completed(task_id, expected=expected)
+
+
+def complete_tasks(task_ids, storage=None):
+    '''Marks a batch of tasks as complete in a single write and returns
+        them. Nothing is changed if any task does not exist.
+    '''
+    storage = storage or default_storage()
+    return storage.set_completed_many(task_ids)
+
+
+def reassign(task_id, username, storage=None, expected=None):
+    '''Assigns an incomplete task to another existing user and returns it'''
+    storage = storage or default_storage()
+    editable_task(storage, task_id)
+    if not storage.has_user(username):
+        raise ValueError(f"User '{username}' does not exist")
+    return storage.reassign(task_id, username, expected=expected)
+
+
+def reassign_all(from_username, to_username, storage=None):
+    '''Assigns every task of one user to another existing user in a
+        single write and returns the changed tasks
+    '''
+    storage = storage or default_storage()
+    if not storage.has_user(to_username):
+        raise ValueError(f"User '{to_username}' does not exist")
+    return storage.reassign_all(from_username, to_username)
+
+
+def set_due_date(task_id, due_date, storage=None, expected=None):
+    '''Changes the due date of an incomplete task and returns it'''
+    storage = storage or default_storage()
+    editable_task(storage, task_id)
+    return storage.set_due_date(task_id, to_date(due_date), expected=expected)
+
+
+def existing_task(storage, task_id):
+    '''Returns a task, raising a ValueError if there is no such task'''
+    task = storage.get(task_id)
+    if task is None:
+        raise ValueError(f"Task {task_id} does not exist")
+    return task
+
+
+def editable_task(storage, task_id):
+    '''Returns a task, raising a ValueError if it cannot be edited'''
+    task = existing_task(storage, task_id)
+    if task.completed:
+        raise ValueError(f"Task {task_id} is already marked as complete and cannot be edited")
+    return task
+
+
+def report(storage=None, today=None):
+    '''Writes the task overview and user overview reports, where tasks due
+        today (or the given date) or earlier are overdue, and returns the
+        total number of tasks and the [total, complete, incomplete,
+        overdue] counts of every user in user order
+    '''
+    storage = storage or default_storage()
+    username_password = storage.users()
+    # Capture the date once so every task is compared to the same day
+    today_ordinal = (date.today() if today is None else to_date(today)).toordinal()
+    # Count the [total, complete, incomplete, overdue] tasks of every user,
+    # which the storage backend does without looking at each task in Python
+    count_tasks, all_user_counts = storage.report_counts(today_ordinal)
+    # Tasks assigned to users missing from the users count towards the task
+    # totals but are not reported
+    count_complete = sum(counts[1] for counts in all_user_counts.values())
+    count_overdue = sum(counts[3] for counts in all_user_counts.values())
+    user_counts = {k: all_user_counts.get(k, [0, 0, 0, 0]) for k in username_password}
+    with open(TASK_OVERVIEW_FILE, "w") as taskoverview_file:
+        taskoverview_file.write(format_task_overview(count_tasks, count_complete, count_overdue))
+    with open(USER_OVERVIEW_FILE, "w") as useroverview_file:
+        useroverview_file.write(format_user_overview_header(len(username_password), count_tasks))
+        # Write the stats for each user in the order they were added
+        for k, counts in user_counts.items():
+            useroverview_file.write(format_user_overview(k, counts, count_tasks))
+    return count_tasks, user_counts
+
+
+def format_task_overview(count_tasks, count_complete, count_overdue):
+    '''Creates the task overview report from the task counts'''
+    count_incomplete = count_tasks - count_complete
+    # Calculate percentages with zero division error handling
+    per_incomplete = 0
+    per_overdue = 0
+    if count_tasks != 0:
+        per_incomplete = 100 * count_incomplete / count_tasks
+        per_overdue = 100 * count_overdue / count_tasks
+    # Create string of task stats in a readable format
+    task_str = f"=======================TASK OVERVIEW=======================\n"
+    task_str += f"Total number of tasks:      \t{count_tasks}\n"
+    task_str += f"Number of completed tasks:  \t{count_complete}\n"
+    task_str += f"Number of uncompleted tasks:\t{count_incomplete}\t {per_incomplete:.2f}% of total tasks\n"
+    task_str += f"Number of overdue tasks:    \t{count_overdue}\t {per_overdue:.2f}% of total tasks\n"
+    return task_str
+
+
+def format_user_overview_header(count_users, count_tasks):
+    '''Creates the header rows of the user overview report'''
+    user_str = f"=======================USER OVERVIEW=======================\n"
+    user_str += f"Total number of users:\t{count_users}\n"
+    user_str += f"Total number of tasks:\t{count_tasks}\n"
+    return user_str
+
+
+def format_user_overview(username, counts, count_tasks):
+    '''Creates the user overview report section for one user from their
+        [total, complete, incomplete, overdue] task counts
+    '''
+    count_user_tasks, count_user_tasks_complete, count_user_tasks_incomplete, count_user_tasks_overdue = counts
+    # Calculate percentages with zero division error handling
+    per_user_tasks = 0
+    per_user_tasks_complete = 0
+    per_user_tasks_incomplete = 0
+    per_user_overdue = 0
+    if count_tasks != 0:
+        per_user_tasks = 100 * count_user_tasks / count_tasks
+    if count_user_tasks != 0:
+        per_user_tasks_complete = 100 * count_user_tasks_complete / count_user_tasks
+        per_user_tasks_incomplete = 100 * count_user_tasks_incomplete / count_user_tasks
+        per_user_overdue = 100 * count_user_tasks_overdue / count_user_tasks
+    # Create string of stats for a user in a readable format
+    user_str = f"\nUser: {username}\n"
+    user_str += f"Total number of tasks:     \t{count_user_tasks}\t {per_user_tasks:.2f}% of total tasks\n"
+    user_str += f"Number of complete tasks:  \t{count_user_tasks_complete}\t {per_user_tasks_complete:.2f}% of total user tasks\n"
+    user_str += f"Number of incomplete tasks:\t{count_user_tasks_incomplete}\t {per_user_tasks_incomplete:.2f}% of total user tasks\n"
+    user_str += f"Number of overdue tasks:   \t{count_user_tasks_overdue}\t {per_user_overdue:.2f}% of total user tasks\n"
+    return user_str
+
+
+def build_parser():
+    '''Creates the command line argument parser'''
+    parser = argparse.ArgumentParser(description="Run Task Manager operations without the menus.")
+    parser.add_argument("--storage", choices=["text", "sqlite"],
+                        help="storage backend (default: TASK_MANAGER_STORAGE or text)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add_parser = commands.add_parser("add", help="add a task")
+    add_parser.add_argument("username")
+    add_parser.add_argument("title")
+    add_parser.add_argument("description")
+    add_parser.add_argument("due_date", help="YYYY-MM-DD")
+    add_parser.add_argument("--assigned", help="assigned date, YYYY-MM-DD (default: today)")
+    complete_parser = commands.add_parser("complete", help="mark tasks as complete")
+    complete_parser.add_argument("task_ids", type=int, nargs="+", metavar="task_id")
+    reassign_parser = commands.add_parser("reassign", help="assign a task to another user")
+    reassign_parser.add_argument("task_id", type=int)
+    reassign_parser.add_argument("username")
+    reassign_all_parser = commands.add_parser("reassign-all", help="assign every task of a user to another user")
+    reassign_all_parser.add_argument("from_username")
+    reassign_all_parser.add_argument("to_username")
+    due_parser = commands.add_parser("due", help="change the due date of a task")
+    due_parser.add_argument("task_id", type=int)
+    due_parser.add_argument("due_date", help="YYYY-MM-DD")
+    import_parser = commands.add_parser("import", help="add every task in a file")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--format", choices=["csv", "jsonl", "txt"],
+                               help="file format (default: from the file extension)")
+    report_parser = commands.add_parser("report", help="write the overview reports")
+    report_parser.add_argument("--today", help="date to count overdue tasks from, YYYY-MM-DD")
+    return parser
+
+
+def main(argv=None):
+    '''Runs one command line operation and returns the exit status'''
+    args = build_parser().parse_args(argv)
+    storage = get_backend(args.storage)
+    storage.initialise()
+    try:
+        if args.command == "add":
+            task = add_task(args.username, args.title, args.description, args.due_date,
+                            args.assigned, storage)
+            print(f"Added task {task.id}.")
+        elif args.command == "complete":
+            if len(args.task_ids) == 1:
+                complete_task(args.task_ids[0], storage)
+            else:
+                complete_tasks(args.task_ids, storage)
+            print(f"{len(args.task_ids)} task(s) marked as complete.")
+        elif args.command == "reassign":
+            reassign(args.task_id, args.username, storage)
+            print(f"Task {args.task_id} assigned to {args.username}.")
+        elif args.command == "reassign-all":
+            tasks = reassign_all(args.from_username, args.to_username, storage)
+            print(f"{len(tasks)} task(s) assigned from {args.from_username} to {args.to_username}.")
+        elif args.command == "import":
+            tasks = import_tasks(args.path, args.format, storage)
+            print(f"Imported {len(tasks)} task(s).")
+        elif args.command == "due":
+            set_due_date(args.task_id, args.due_date, storage)
+            print(f"Task {args.task_id} due date changed to {args.due_date}.")
+        elif args.command == "report":
+            count_tasks, user_counts = report(storage, args.today)
+            print(f"Reports written for {count_tasks} tasks and {len(user_counts)} users.")
+    # Invalid input, including badly formatted dates and missing files
+    except (ValueError, TaskConflictError, OSError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+    return 0
+
+
+# Run the operation named on the command line
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+"""
+================================TASK ARCHIVE================================
+Completed tasks make up most of a long used task list, but after a while
+they are only ever counted in the reports. This module moves tasks that
+were completed more than ARCHIVE_DAYS days ago out of tasks.txt into
+compressed archive segments, so the snapshot that is read, indexed and
+rewritten only holds the tasks still being worked on:
+- every archiving run writes one new segment file (tasks_archive_0001.txt.gz,
+tasks_archive_0002.txt.gz, ...) holding the archived tasks in the escaped
+task format (see task_record.py)
+- segments are compressed with zstd when the zstandard module is
+installed, and with gzip otherwise
+- tasks_archive.json lists the segments along with aggregates worked out
+when they were written: the number of archived tasks of each user and the
+highest archived task id, so the reports and new task ids never need a
+segment to be opened
+- tasks_archive_completed.json holds the day each completed task in
+tasks.txt was completed, as a day ordinal by task id, and
+tasks_archive_completed.log the days recorded since, one "<id>;<day>" line
+per task completed in place (with no day for a task reopened in place)
+
+Archived tasks are complete and never change again, so they only add to
+the total and complete counts of their user.
+
+Tasks are archived automatically whenever the snapshot is rewritten (see
+TaskStore.compact). The age is set with the TASK_MANAGER_ARCHIVE_DAYS
+environment variable, where 0 turns archiving off.
+
+Task records have no completion date, so a task's completion day is
+recorded when it is completed in place in the snapshot (see task_mmap.py),
+or otherwise the first time the snapshot is rewritten with the task
+complete. That is never before the task was completed, and as the snapshot
+is rewritten when the program exits after any logged edit, it is usually
+the same day. A task found reopened at a rewrite loses its completion day, and a
+task is only archived once it has been complete for ARCHIVE_DAYS days,
+however long ago it was due.
+"""
+
+# Import libraries
+import gzip
+import json
+import os
+from task_files import write_atomic, file_state
+from task_record import parse_task, format_task, TASK_FILE_HEADER
+
+# zstandard is optional and only used to compress new segments when installed
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Default file name of the archive index, which the segment names are
+# based on
+TASK_ARCHIVE_FILE = "tasks_archive.json"
+
+# Environment variable used to choose the number of days a task must have
+# been complete before it is archived, counted from the day its completion
+# was recorded (not its due date), and the number used if it is not set
+ARCHIVE_DAYS_VARIABLE = "TASK_MANAGER_ARCHIVE_DAYS"
+ARCHIVE_DAYS = 365
+
+
+def default_archive_days():
+    '''Returns the archive age chosen by the TASK_MANAGER_ARCHIVE_DAYS
+        environment variable, or the default age
+    '''
+    days = os.environ.get(ARCHIVE_DAYS_VARIABLE)
+    return ARCHIVE_DAYS if days is None else int(days)
+
+
+def compress(data):
+    '''Compresses segment data, returning it with the file extension of the
+        compression used
+    '''
+    if zstandard is not None:
+        return zstandard.ZstdCompressor().compress(data), ".zst"
+    return gzip.compress(data, mtime=0), ".gz"
+
+
+def decompress(data, path):
+    '''Decompresses the data of a segment file, going by its extension'''
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise ValueError(f"Archive segment {path} needs the zstandard module to be read")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+class TaskArchive:
+    '''Compressed segments of archived tasks, with their aggregates'''
+
+    def __init__(self, index_path=TASK_ARCHIVE_FILE):
+        self.index_path = index_path
+        self.folder = os.path.dirname(index_path)
+        # Completion days of the completed tasks not yet archived
+        base = os.path.splitext(index_path)[0]
+        self.completed_path = f"{base}_completed.json"
+        self.completed_log_path = f"{base}_completed.log"
+        # Segment file names, archived task counts by username and the
+        # highest archived task id, as saved in the archive index
+        self.segments = []
+        self.user_archived = {}
+        self.max_id = 0
+        # Inode, size and modification time of the index when last read
+        self.state = None
+
+    def refresh(self):
+        '''Reads the archive index again if it has changed'''
+        state = file_state(self.index_path)
+        if state == self.state:
+            return self
+        if state is None:
+            self.segments = []
+            self.user_archived = {}
+            self.max_id = 0
+        else:
+            with open(self.index_path, "r") as index_file:
+                data = json.load(index_file)
+            self.segments = data["segments"]
+            self.user_archived = data["users"]
+            self.max_id = data["max_id"]
+        self.state = state
+        return self
+
+    def __len__(self):
+        return sum(self.refresh().user_archived.values())
+
+    def user_counts(self):
+        '''Returns a dictionary of username to number of archived tasks'''
+        return dict(self.refresh().user_archived)
+
+    def next_id(self):
+        '''Returns the lowest task id that has never been archived'''
+        return self.refresh().max_id + 1
+
+    def completion_days(self):
+        '''Returns a dictionary of task id to the day ordinal each completed
+            task was recorded as complete
+        '''
+        try:
+            with open(self.completed_path, "r") as completed_file:
+                completion_days = {int(task_id): day for task_id, day in json.load(completed_file).items()}
+        except FileNotFoundError:
+            completion_days = {}
+        # Apply the days recorded since the saved days were written
+        try:
+            with open(self.completed_log_path, "r") as log_file:
+                for line in log_file:
+                    task_id, _, day = line.rstrip("\n").partition(";")
+                    if day:
+                        completion_days.setdefault(int(task_id), int(day))
+                    elif task_id:
+                        completion_days.pop(int(task_id), None)
+        except FileNotFoundError:
+            pass
+        return completion_days
+
+    def save_completion_days(self, completion_days):
+        '''Saves the completion days of the completed tasks not yet archived,
+            while the caller holds the task store lock
+        '''
+        write_atomic(self.completed_path, json.dumps(completion_days))
+        # Only remove the recorded days once the saved days include them
+        if os.path.exists(self.completed_log_path):
+            os.remove(self.completed_log_path)
+
+    def record_completion(self, task_id, day):
+        '''Records the day a task was completed, or that it was reopened if
+            day is None, by appending a line instead of saving every day,
+            while the caller holds the task store lock
+        '''
+        with open(self.completed_log_path, "a") as log_file:
+            log_file.write(f"{task_id};{'' if day is None else day}\n")
+
+    def add(self, tasks):
+        '''Writes completed tasks to a new segment and adds them to the
+            aggregates, while the caller holds the task store lock
+        '''
+        self.refresh()
+        lines = [TASK_FILE_HEADER]
+        lines.extend(format_task(task) for task in tasks)
+        data, extension = compress("\n".join(lines).encode("utf-8"))
+        base = os.path.splitext(os.path.basename(self.index_path))[0]
+        segment = f"{base}_{len(self.segments) + 1:04d}.txt{extension}"
+        write_atomic(os.path.join(self.folder, segment), data)
+        for task in tasks:
+            self.user_archived[task.username] = self.user_archived.get(task.username, 0) + 1
+            self.max_id = max(self.max_id, task.id)
+        self.segments.append(segment)
+        index = {"segments": self.segments, "users": self.user_archived, "max_id": self.max_id}
+        write_atomic(self.index_path, json.dumps(index))
+        self.state = file_state(self.index_path)
+
+    def iter_tasks(self):
+        '''Yields every archived task, one segment at a time'''
+        for segment in self.refresh().segments:
+            path = os.path.join(self.folder, segment)
+            with open(path, "rb") as segment_file:
+                text = decompress(segment_file.read(), path).decode("utf-8")
+            for t_str in text.split("\n")[1:]:
+                if t_str != "":
+                    yield parse_task(t_str, 0, True)
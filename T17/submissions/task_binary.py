@@ -0,0 +1,226 @@
+"""
+================================TASK BINARY================================
+This module adds an optional binary task file (tasks.bin) with one fixed
+width record per task, as an alternative to the semicolon separated lines
+of tasks.txt, which have to be split and have their dates parsed one task
+at a time. The file has four parts:
+- header:  b"TBIN", the format version, and the number of tasks, users
+           and bytes of text
+- users:   the position and length of each username in the text heap
+- records: one RECORD per task, in task id order, holding the task id,
+           the user's number, the due and assigned dates as day ordinals,
+           the completed flag and the position and length of the title and
+           description in the text heap
+- heap:    the UTF-8 text of every username, title and description, with
+           each distinct string stored once
+Positions and lengths in the heap are counted in characters, so the heap
+is decoded once and each string is then a slice of it.
+
+The records are read with struct.unpack_from straight out of a memoryview
+of the file, so nothing is copied or split and no dates are parsed, and
+fields such as the due dates and completion flags can be read without
+creating any strings at all.
+
+tasks.txt stays the file the Task Manager works with. Convert between the
+two formats with:
+    python task_binary.py to-binary [--tasks tasks.txt] [--binary tasks.bin]
+    python task_binary.py to-text [--binary tasks.bin] [--tasks tasks.txt]
+The change log and saved statistics used are the ones named after the
+text task file (tasks.log and tasks_stats.json for tasks.txt, see
+task_store.py), so converting one task file never reads or removes the
+change log of another in the same folder. Another change log can be given
+with --log.
+"""
+
+# Import libraries
+import argparse
+import struct
+import sys
+from bisect import bisect_left
+from task_files import write_atomic
+from task_record import Task
+from task_store import TaskStore, TASK_FILE
+
+# Default file name of the binary task file
+TASK_BINARY_FILE = "tasks.bin"
+
+# Marker at the start of every binary task file, and the format version
+BINARY_MARKER = b"TBIN"
+BINARY_VERSION = 1
+
+# Layout of the header, of each username entry and of each task record
+HEADER = struct.Struct("<4sHxxIIQ")
+USER = struct.Struct("<II")
+RECORD = struct.Struct("<iIiiB3xIIII")
+
+
+def pack_tasks(tasks):
+    '''Converts any iterable of tasks to the bytes of a binary task file'''
+    heap = []
+    heap_length = 0
+    # Position and length in the heap of each distinct string
+    strings = {}
+    user_numbers = {}
+    users = bytearray()
+    records = bytearray()
+
+    def heap_entry(text):
+        '''Returns the position and length of a string in the heap, adding
+            it the first time it is seen
+        '''
+        nonlocal heap_length
+        entry = strings.get(text)
+        if entry is None:
+            entry = strings[text] = (heap_length, len(text))
+            heap.append(text)
+            heap_length += len(text)
+        return entry
+
+    count = 0
+    for task in tasks:
+        user_number = user_numbers.get(task.username)
+        if user_number is None:
+            user_number = user_numbers[task.username] = len(user_numbers)
+            users.extend(USER.pack(*heap_entry(task.username)))
+        records.extend(RECORD.pack(task.id, user_number, task.due, task.assigned, task.completed,
+                                   *heap_entry(task.title), *heap_entry(task.description)))
+        count += 1
+    heap = "".join(heap).encode("utf-8")
+    header = HEADER.pack(BINARY_MARKER, BINARY_VERSION, count, len(user_numbers), len(heap))
+    return b"".join([header, users, records, heap])
+
+
+def write_binary(tasks, path=TASK_BINARY_FILE):
+    '''Writes any iterable of tasks to a binary task file in one step, and
+        returns the number of bytes written
+    '''
+    data = pack_tasks(tasks)
+    write_atomic(path, data)
+    return len(data)
+
+
+class BinaryTaskFile:
+    '''Read-only access to the tasks in the bytes of a binary task file'''
+
+    def __init__(self, data):
+        self.view = memoryview(data)
+        if len(self.view) < HEADER.size:
+            raise ValueError("Not a binary task file")
+        marker, version, self.count, user_count, heap_size = HEADER.unpack_from(self.view)
+        if marker != BINARY_MARKER:
+            raise ValueError("Not a binary task file")
+        if version != BINARY_VERSION:
+            raise ValueError(f"Unsupported binary task file version {version}")
+        # Where each part of the file starts
+        self.records_start = HEADER.size + user_count * USER.size
+        self.heap_start = self.records_start + self.count * RECORD.size
+        if len(self.view) != self.heap_start + heap_size:
+            raise ValueError("Binary task file is incomplete")
+        self.heap = str(self.view[self.heap_start:], "utf-8")
+        # Usernames are few and used by every task, so they are decoded once
+        self.usernames = [
+            self.text(*USER.unpack_from(self.view, HEADER.size + number * USER.size))
+            for number in range(user_count)
+        ]
+
+    @classmethod
+    def from_path(cls, path=TASK_BINARY_FILE):
+        '''Reads a binary task file'''
+        with open(path, "rb") as binary_file:
+            return cls(binary_file.read())
+
+    def __len__(self):
+        return self.count
+
+    def text(self, offset, length):
+        '''Returns a string from the heap'''
+        return self.heap[offset:offset + length]
+
+    def record(self, row):
+        '''Returns the raw fields of the task record on a row (from 0) as
+            (id, user number, due, assigned, completed, title offset, title
+            length, description offset, description length)
+        '''
+        return RECORD.unpack_from(self.view, self.records_start + row * RECORD.size)
+
+    def records(self):
+        '''Yields the raw fields of every task record in order'''
+        return RECORD.iter_unpack(self.view[self.records_start:self.heap_start])
+
+    def task(self, row):
+        '''Returns the task on a row (from 0)'''
+        return self._task(self.record(row))
+
+    def tasks(self):
+        '''Returns every task in task id order'''
+        heap = self.heap
+        usernames = self.usernames
+        return [
+            Task(task_id, usernames[user], heap[title_at:title_at + title_size],
+                 heap[text_at:text_at + text_size], due, assigned, completed == 1)
+            for task_id, user, due, assigned, completed, title_at, title_size, text_at, text_size
+            in self.records()
+        ]
+
+    def find(self, task_id):
+        '''Returns the task with the given task id, or None, found with a
+            binary search of the records
+        '''
+        row = bisect_left(range(self.count), task_id, key=lambda row: self.record(row)[0])
+        if row < self.count and self.record(row)[0] == task_id:
+            return self.task(row)
+        return None
+
+    def _task(self, record):
+        '''Creates a Task from the raw fields of a task record'''
+        task_id, user, due, assigned, completed, title_at, title_size, text_at, text_size = record
+        return Task(task_id, self.usernames[user], self.text(title_at, title_size),
+                    self.text(text_at, text_size), due, assigned, completed == 1)
+
+
+def text_to_binary(task_path=TASK_FILE, binary_path=TASK_BINARY_FILE, log_path=None):
+    '''Writes the tasks in tasks.txt, with the change log applied, to a
+        binary task file, and returns the number of tasks
+    '''
+    store = TaskStore(task_path, log_path)
+    tasks = list(store.iter_tasks())
+    write_binary(tasks, binary_path)
+    return len(tasks)
+
+
+def binary_to_text(binary_path=TASK_BINARY_FILE, task_path=TASK_FILE, log_path=None):
+    '''Replaces the tasks in tasks.txt, and any change log, with the tasks
+        in a binary task file, and returns the number of tasks
+    '''
+    tasks = BinaryTaskFile.from_path(binary_path).tasks()
+    TaskStore(task_path, log_path).replace_all(tasks)
+    return len(tasks)
+
+
+def main(argv=None):
+    '''Converts between the text and binary task files and returns the exit
+        status
+    '''
+    parser = argparse.ArgumentParser(description="Convert between tasks.txt and the binary task file.")
+    parser.add_argument("command", choices=["to-binary", "to-text"])
+    parser.add_argument("--tasks", default=TASK_FILE, help="text task file (default: tasks.txt)")
+    parser.add_argument("--binary", default=TASK_BINARY_FILE, help="binary task file (default: tasks.bin)")
+    parser.add_argument("--log", help="change log of the text task file (default: named after it, e.g. tasks.log)")
+    args = parser.parse_args(argv)
+    try:
+        if args.command == "to-binary":
+            count = text_to_binary(args.tasks, args.binary, args.log)
+            print(f"Wrote {count} task(s) to {args.binary}.")
+        else:
+            count = binary_to_text(args.binary, args.tasks, args.log)
+            print(f"Wrote {count} task(s) to {args.tasks}.")
+    # Missing or damaged files
+    except (ValueError, OSError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+    return 0
+
+
+# Run the conversion named on the command line
+if __name__ == "__main__":
+    sys.exit(main())
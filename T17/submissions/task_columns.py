@@ -0,0 +1,160 @@
+"""
+================================TASK COLUMNS================================
+This module holds the three task fields the overview reports need in
+compact columns instead of one object per task:
+- user:      the assigned username of each task as a small int (the
+             usernames are interned so each is stored once), in an array('i')
+- due:       the due date of each task as a day ordinal, in an array('i')
+- completed: a bytearray holding 1 for each completed task and 0 otherwise
+
+The rows are sorted by user, then completion, then due date, so each
+user's tasks are one block of the columns with their incomplete tasks
+first in due date order. Without NumPy the counts for a user are then a
+count of the completed flags in their block and a binary search of their
+incomplete due dates, so no Python code runs per task. When NumPy is
+installed the columns are counted with numpy.bincount instead.
+
+The task store keeps its columns up to date as tasks change (see
+TaskStore.get_columns), moving one row in or out of its sorted place, so
+the columns are only built once per load of the task files.
+"""
+
+# Import libraries
+from array import array
+from bisect import bisect_left, bisect_right
+
+# NumPy is optional and only used to speed up the counts when installed
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Bit positions used to pack a row into a single int sort key: the due date
+# ordinal fits in the low 22 bits, followed by the completed flag
+_COMPLETED_SHIFT = 22
+_USER_SHIFT = 23
+
+class TaskColumns:
+    '''Column store of the username, due date and completion of every task'''
+
+    def __init__(self):
+        # Interned usernames and the index of each username in the list
+        self.usernames = []
+        self.user_ids = {}
+        # One entry per task in each column
+        self.user = array('i')
+        self.due = array('i')
+        self.completed = bytearray()
+        # Position of the first row of each user id's block of rows, followed
+        # by the total number of rows
+        self.starts = array('i', [0])
+
+    @classmethod
+    def from_tasks(cls, tasks):
+        '''Builds the sorted columns from any iterable of tasks'''
+        columns = cls()
+        user_ids = columns.user_ids
+        # Pack each row into an int so the rows can be sorted quickly
+        keys = []
+        for task in tasks:
+            user_id = user_ids.get(task.username)
+            if user_id is None:
+                user_id = user_ids[task.username] = len(columns.usernames)
+                columns.usernames.append(task.username)
+            keys.append(user_id << _USER_SHIFT | task.completed << _COMPLETED_SHIFT | task.due)
+        keys.sort()
+        columns.user = array('i', [key >> _USER_SHIFT for key in keys])
+        columns.completed = bytearray(key >> _COMPLETED_SHIFT & 1 for key in keys)
+        columns.due = array('i', [key & ((1 << _COMPLETED_SHIFT) - 1) for key in keys])
+        # Find where each user's block of rows starts
+        columns.starts = array('i', [
+            bisect_left(columns.user, user_id) for user_id in range(len(columns.usernames) + 1)
+        ])
+        return columns
+
+    def __len__(self):
+        return len(self.user)
+
+    def add_task(self, task):
+        '''Adds the row of a task that has been added or has just been
+            changed, in its sorted place
+        '''
+        user_id = self.user_ids.get(task.username)
+        if user_id is None:
+            # A new user's block goes after every other block
+            user_id = self.user_ids[task.username] = len(self.usernames)
+            self.usernames.append(task.username)
+            self.starts.append(self.starts[-1])
+        row = self._row(user_id, task.completed, task.due, bisect_right)
+        self.user.insert(row, user_id)
+        self.due.insert(row, task.due)
+        self.completed.insert(row, task.completed)
+        self._move_starts(user_id, 1)
+
+    def remove_task(self, task):
+        '''Removes the row of a task, called before the task is changed'''
+        user_id = self.user_ids[task.username]
+        row = self._row(user_id, task.completed, task.due, bisect_left)
+        del self.user[row]
+        del self.due[row]
+        del self.completed[row]
+        self._move_starts(user_id, -1)
+
+    def _row(self, user_id, completed, due, bisect):
+        '''Finds the row for a due date in the incomplete or completed part
+            of a user's block of rows with the given bisect function
+        '''
+        start = self.starts[user_id]
+        end = self.starts[user_id + 1]
+        # Incomplete rows come first in the block, then the completed rows
+        middle = bisect_left(self.completed, 1, start, end)
+        if completed:
+            return bisect(self.due, due, middle, end)
+        return bisect(self.due, due, start, middle)
+
+    def _move_starts(self, user_id, step):
+        '''Moves the start of every block after a user's block by a row'''
+        for next_id in range(user_id + 1, len(self.starts)):
+            self.starts[next_id] += step
+
+    def user_counts(self, today_ordinal):
+        '''Returns a dictionary of username to [total, complete, incomplete,
+            overdue] task counts, where tasks due today or earlier are overdue
+        '''
+        if numpy is not None:
+            totals, completes, overdues = self._numpy_counts(today_ordinal)
+        else:
+            totals, completes, overdues = self._python_counts(today_ordinal)
+        user_counts = {}
+        for user_id, username in enumerate(self.usernames):
+            total = int(totals[user_id])
+            complete = int(completes[user_id])
+            user_counts[username] = [total, complete, total - complete, int(overdues[user_id])]
+        return user_counts
+
+    def _python_counts(self, today_ordinal):
+        '''Counts the tasks of each user id from their block of rows'''
+        totals = []
+        completes = []
+        overdues = []
+        for user_id in range(len(self.usernames)):
+            start = self.starts[user_id]
+            end = self.starts[user_id + 1]
+            complete = self.completed.count(1, start, end)
+            # Incomplete tasks come first in the block, sorted by due date
+            overdue = bisect_right(self.due, today_ordinal, start, end - complete) - start
+            totals.append(end - start)
+            completes.append(complete)
+            overdues.append(overdue)
+        return totals, completes, overdues
+
+    def _numpy_counts(self, today_ordinal):
+        '''Counts the tasks of each user id with NumPy, without copying'''
+        size = len(self.usernames)
+        user = numpy.frombuffer(self.user, dtype=numpy.int32)
+        due = numpy.frombuffer(self.due, dtype=numpy.int32)
+        completed = numpy.frombuffer(self.completed, dtype=numpy.uint8).astype(bool)
+        totals = numpy.bincount(user, minlength=size)
+        completes = numpy.bincount(user[completed], minlength=size)
+        overdues = numpy.bincount(user[~completed & (due <= today_ordinal)], minlength=size)
+        return totals, completes, overdues
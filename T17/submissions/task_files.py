@@ -0,0 +1,33 @@
+"""
+=================================TASK FILES=================================
+This module holds the file helpers shared by the task and user stores and
+the task file index (see task_mmap.py): writing a file in one step, and
+reading the state used to tell whether a file has changed.
+"""
+
+# Import libraries
+import os
+
+
+def write_atomic(path, text):
+    '''Writes a text (or bytes) file by writing a temporary file and moving
+        it into place, so the file is never seen half written
+    '''
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb" if isinstance(text, bytes) else "w") as temp_file:
+        temp_file.write(text)
+        temp_file.flush()
+        os.fsync(temp_file.fileno())
+    os.replace(temp_path, path)
+
+
+def file_state(path):
+    '''Returns the inode, size and modification time of a file, given by
+        path or open file descriptor, as a list, or None if the file does
+        not exist
+    '''
+    try:
+        file_stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns]
@@ -6,11 +6,22 @@ This program is a Task Manager, which has the following functionality:
     ru - Register a user
     at - Add a task
     va - View all tasks
+    vp - View all tasks a page at a time
+    wf - Write all tasks to a file
     vm - View my task
+    od - View overdue tasks
+    dw - View tasks due within a number of days
     gr - Generate reports
     ds - Display statistics (admin user only)
     ex - Exit
 
+- The 'vp' option shows a page of tasks at a time, with the PAGE MENU:
+    n  - Next page
+    p  - Previous page
+    j  - Jump to the page showing a Task#
+    s  - Change the page size
+    ex - Exit to Main Menu
+
 - The 'vm' option allows users to choose a task to edit
 - The user is presented with an EDIT MENU with the following options:
     tc - Mark task as complete
@@ -24,34 +35,49 @@ Notes:
     password: password
 2. Ensure you open the whole folder for this task in VS Code otherwise the 
 program will look in your root directory for the text files.
+3. Edits are saved to tasks.log as they happen and merged into tasks.txt
+when the log fills up or the program exits (see task_store.py).
+4. Passwords are stored as salted hashes (see credentials.py), and any
+plain text passwords in user.txt are hashed when the program starts.
+5. Set the TASK_MANAGER_STORAGE environment variable to "sqlite" to keep
+tasks and users in a SQLite database instead (see storage.py).
+6. Scripts can add and edit tasks and write the reports without the menus,
+using task_api.py as a module or from the command line.
+7. Tasks that have been complete for more than a year are moved to a
+compressed archive when tasks.txt is rewritten, and no longer shown in the
+task lists. They are still counted in the reports and statistics (see
+task_archive.py).
 """
 
 # Import libraries
-import os
-from datetime import datetime, date
+import sys
+from datetime import date
+from task_record import parse_date
+from task_render import render_task, write_rendered
+from task_api import report, format_task_overview, format_user_overview_header, format_user_overview
+from task_store import TaskConflictError
+from storage import get_backend
+from credentials import Credentials
+
+# Storage backend holding the tasks and users
+storage = get_backend()
 
-# Set date string format
-DATETIME_STRING_FORMAT = "%Y-%m-%d"
+# Hashed passwords of the users in the storage backend
+credentials = Credentials(storage)
 
 def main():
     '''The main Task Manager program'''
+    # Create empty task and user storage with a default account if needed
+    storage.initialise()
+    # Hash any passwords still stored as plain text
+    credentials.migrate()
     # User log in & creation of curr_user variable for user specific functions
     curr_user = login()
-    # Create tasks.txt file if it does not exist
-    if not os.path.exists("tasks.txt"):
-        with open("tasks.txt", "w") as default_file:
-            pass
     # Present user with the MAIN MENU to select desired task manager action
     main_menu(curr_user)
 
 def login():
     '''Log in to Task Manager with a valid username and password.'''
-    # Create user.txt file with a default account if it does not exist
-    if not os.path.exists("user.txt"):
-        with open("user.txt", "w") as user_file:
-            user_file.write("admin;password")
-    # Read user.txt file to return dictionary of usernames and passwords
-    username_password = read_userfile()        
     # User can only log in with a valid username and password
     logged_in = False
     while not logged_in:
@@ -59,11 +85,11 @@ def login():
         curr_user = input("Username: ")
         curr_pass = input("Password: ")
         # Error handling for invalid user
-        if curr_user not in username_password.keys():
+        if not storage.has_user(curr_user):
             print("User does not exist")
             continue
         # Error handling for incorrect user password
-        elif username_password[curr_user] != curr_pass:
+        elif not credentials.check(curr_user, curr_pass):
             print("Wrong password")
             continue
         else:
@@ -72,53 +98,53 @@ def login():
     return curr_user
 
 def main_menu(curr_user):
-    '''Present the MAIN MENU to the user'''
-    while True:
-        # User input converted to lower case for handling incorrect capitalisation
-        menu = input('''\nMAIN MENU
+    '''Runs the menus until the user exits. Each menu is a screen function
+        that returns the next screen to show and the task it is for, so
+        moving between menus never nests function calls and the call stack
+        stays the same depth however long the session lasts
+    '''
+    screen, task_choice = main_screen, None
+    while screen is not None:
+        screen, task_choice = screen(curr_user, task_choice)
+
+def main_screen(curr_user, task_choice):
+    '''Present the MAIN MENU to the user and run the chosen option'''
+    # User input converted to lower case for handling incorrect capitalisation
+    menu = input('''\nMAIN MENU
 Select one of the following Options below:
 ru - Register a user
 at - Add a task
 va - View all tasks
+vp - View all tasks a page at a time
+wf - Write all tasks to a file
 vm - View my tasks
+od - View overdue tasks
+dw - View tasks due within a number of days
 gr - Generate reports
 ds - Display statistics (admin user only)
 ex - Exit
 : ''').lower()
-        # Run register user function
-        if menu == 'ru':
-            reg_user()
-        # Run add task function    
-        elif menu == 'at':
-            add_task()
-        # Run view all tasks function
-        elif menu == 'va':
-            view_all()
-        # Run view my tasks function
-        elif menu == 'vm':
-            view_mine(curr_user)  
-        # Run generate reports function
-        elif menu == 'gr':
-            generate_reports()
-        # Only allow admin user to run the display statistics function
-        elif menu == 'ds' and curr_user == 'admin':
-            display_stats()
-        # Exit the program
-        elif menu == 'ex':
-            print('\nThankyou for using Task Manager!')
-            exit()
-        # Error handling for invalid user input
-        else:
-            print("\nYou have made a wrong choice, Please Try again")
+    option = MAIN_MENU_OPTIONS.get(menu)
+    # Error handling for invalid user input, and only allow admin user to
+    # run the admin options
+    if option is None or (menu in ADMIN_OPTIONS and curr_user != 'admin'):
+        print("\nYou have made a wrong choice, Please Try again")
+        return main_screen, None
+    # Options return the next screen, or None to come back to the MAIN MENU
+    return option(curr_user) or (main_screen, None)
+
+def exit_program():
+    '''Saves all logged changes to tasks.txt and leaves Task Manager'''
+    storage.compact()
+    print('\nThankyou for using Task Manager!')
+    return None, None
 
 def reg_user():
     '''Add a new user to the user.txt file'''
-    # Read user.txt file to return dictionary of usernames and passwords
-    username_password = read_userfile()
     # Request input of a new username
     new_username = input("New Username: ")
     # Check if the user already exists
-    while new_username in username_password.keys():
+    while storage.has_user(new_username):
         print("Username already exists. Please add user with a different username.")
         # Allow user to enter a different username
         new_username = input("New Username: ")
@@ -128,14 +154,9 @@ def reg_user():
     confirm_password = input("Confirm Password: ")
     # Check if the new password and confirmed password are the same
     if new_password == confirm_password:
-        # If the paswords match, add the user and password to the user.txt file
+        # If the paswords match, add the user and a hash of the password to the user.txt file
         print("New user added")
-        username_password[new_username] = new_password  
-        with open("user.txt", "w") as out_file:
-            user_data = []
-            for k in username_password:
-                user_data.append(f"{k};{username_password[k]}")
-            out_file.write("\n".join(user_data))
+        credentials.add_user(new_username, new_password)
     # Notify user that the passwords do not match before returning to the MAIN MENU
     else:
         print("Passwords do no match")
@@ -147,12 +168,10 @@ def add_task():
          - A description of the task
          - The due date of the task
     '''
-    # Read user.txt file to return dictionary of usernames and passwords
-    username_password = read_userfile()
     # Request input of an existing username for the task
     task_username = input("Name of person assigned to task: ")
     # Check if username exists
-    while task_username not in username_password.keys():
+    while not storage.has_user(task_username):
         print("User does not exist. Please enter a valid username")
         # Allow user to enter an existing username for the task
         task_username = input("Name of person assigned to task: ")
@@ -164,340 +183,358 @@ def add_task():
     while True:
         try:
             task_due_date = input("Due date of task (YYYY-MM-DD): ")
-            due_date_time = datetime.strptime(task_due_date, DATETIME_STRING_FORMAT)
+            due_date_time = parse_date(task_due_date)
             break
         except ValueError:
             print("Invalid datetime format. Please use the format specified")
     # Get the current date to set as the task assigned date
     curr_date = date.today()
-    # Add the task data to the file task.txt and default task completed to 'No'
-    updated_tasks = read_tasks()
-    new_task = {
-        "username": task_username,
-        "title": task_title,
-        "description": task_description,
-        "due_date": due_date_time,
-        "assigned_date": curr_date,
-        "completed": False
-    }
-    updated_tasks.append(new_task)
-    # Write the updated task list to the task.txt file
-    write_tasks(updated_tasks)
+    # Add the task to the task store and default task completed to 'No'
+    storage.add(task_username, task_title, task_description, due_date_time, curr_date)
+    print("Task file successfully updated.")
 
 def view_all():
-    '''Reads all the tasks from the task list variable and
-        calls the display_task function to print to the console
+    '''Streams every task through the shared task template and writes
+        them to the console in large batches with write_rendered
     '''
-    # Displays all tasks in the task list
-    for task in read_tasks():
-        display_task(task)
+    # Displays all tasks as they are read, without loading the whole task list,
+    # writing them to the console in large batches
+    write_rendered(iter_tasks())
+
+def export_tasks():
+    '''Writes every task to a file or pipe named by the user, in the
+        same layout as view_all
+    '''
+    file_name = input("Name of file to write the tasks to: ")
+    try:
+        with open(file_name, "w") as out_file:
+            count = write_rendered(iter_tasks(), out_file)
+    # Error handling for a file that cannot be written
+    except OSError as error:
+        print(f"\nCould not write to {file_name}: {error.strerror}")
+    else:
+        print(f"\n{count} task(s) written to {file_name}.")
             
+def view_pages():
+    '''Displays the tasks one page at a time, letting the user move
+        between pages, jump to a task or change the page size
+    '''
+    # Only the tasks on the page shown are read from the task file
+    pager = storage.pager()
+    page_number = 1
+    while True:
+        page_count = pager.page_count()
+        page_number = min(page_number, page_count)
+        for task in pager.page(page_number):
+            display_task(task)
+        print(f"Page {page_number} of {page_count}")
+        # User input converted to lower case for handling incorrect capitalisation
+        page_choice = input('''\nPAGE MENU
+n  - Next page
+p  - Previous page
+j  - Jump to a Task#
+s  - Change the page size
+ex - Exit to Main Menu
+: ''').lower()
+        if page_choice == 'n':
+            if page_number < page_count:
+                page_number += 1
+            else:
+                print("\nThis is the last page.")
+        elif page_choice == 'p':
+            if page_number > 1:
+                page_number -= 1
+            else:
+                print("\nThis is the first page.")
+        elif page_choice == 'j':
+            try:
+                # Error handling for invalid integer task# entry
+                task_page = pager.page_of(int(input("Task#: ")))
+            except ValueError:
+                print("Invalid Task# selection.")
+            else:
+                if task_page is None:
+                    print("\nThere is no task with that Task#.")
+                else:
+                    page_number = task_page
+        elif page_choice == 's':
+            try:
+                # Error handling for invalid page size entry
+                page_size = int(input("Tasks per page: "))
+            except ValueError:
+                print("Invalid page size. Please enter a whole number.")
+            else:
+                if page_size >= 1:
+                    # Keep the first task on the page in view
+                    first_row = (page_number - 1) * pager.page_size
+                    pager.page_size = page_size
+                    page_number = first_row // page_size + 1
+                else:
+                    print("Invalid page size. Please enter 1 or more.")
+        elif page_choice == 'ex':
+            break
+        # Error handling for invalid user input
+        else:
+            print("\nYou have made a wrong choice, Please Try again")
+
 def view_mine(curr_user):
     '''Reads only the user's tasks from the task list variable, then:
         - calls the display_task function to print to the console
         - gives the user the option to select a task to edit or
         return to the main menu
     '''   
-    # Displays only the current user's tasks from the task list
-    my_tasks = []
-    my_task_ids = []
-    tasks = read_tasks()
-    for task in tasks:
-        if task['username'] == curr_user:
-            display_task(task)
-            my_tasks.append(task)
-            my_task_ids.append(task['index'])
+    # Displays only the current user's tasks, found with the username index
+    for task in storage.tasks_for_user(curr_user):
+        display_task(task)
     # Give user a choice to edit a task or return to the main menu
-    task_choice = 0
-    while task_choice != -1:
+    return select_task_screen, None
+
+def select_task_screen(curr_user, task_choice):
+    '''Asks the user for a task to edit, or -1 to return to the main menu'''
+    try:
+        # Error handling for invalid integer task# entry
+        task_choice = int(input("Enter a valid Task# to edit or -1 to return to the main menu: "))
+    # Error handling for non-integer entry 
+    except ValueError:
+        print("Invalid Task# selection.")
+        return select_task_screen, None
+    if task_choice == -1:
+        return main_screen, None
+    # Look up the selected task by its id
+    task = storage.get(task_choice)
+    # Prevent user from editing another user's task
+    if task is None or task.username != curr_user:
+        print(f"\nTask {task_choice} is not assigned to you.")
+        return select_task_screen, None
+    # Prevent user from editing a completed task
+    if task.completed:
+        print(f"\nTask {task_choice} is already marked as complete and cannot be edited.")
+        return select_task_screen, None
+    # Present user with the EDIT MENU where valid task entered
+    return edit_screen, task_choice
+
+def view_overdue():
+    '''Displays every incomplete task due today or earlier, oldest first'''
+    # The due date index finds the overdue tasks without reading every task
+    overdue_tasks = storage.overdue_tasks(date.today().toordinal())
+    for task in overdue_tasks:
+        display_task(task)
+    print(f"\n{len(overdue_tasks)} overdue task(s).")
+
+def view_due_within():
+    '''Displays every incomplete task due in the next number of days
+        entered by the user, soonest first
+    '''
+    while True:
         try:
-            # Error handling for invalid integer task# entry
-            task_choice = int(input("Enter a valid Task# to edit or -1 to return to the main menu: "))
-        # Error handling for non-integer entry 
+            # Error handling for invalid number of days entry
+            days = int(input("Number of days ahead to show tasks due: "))
         except ValueError:
-            print("Invalid Task# selection.")
-        # Prevent user from editing another user's task
+            print("Invalid number of days. Please enter a whole number.")
         else:
-            if task_choice != -1 and task_choice not in my_task_ids:
-                print(f"\nTask {task_choice} is not assigned to you.")
-            else:
-                for task in my_tasks:
-                    # Prevent user from editing a completed task
-                    if task['index'] == task_choice and task['completed']:
-                        print(f"\nTask {task_choice} is already marked as complete and cannot be edited.")
-                    # Present user with the EDIT MENU where valid task entered
-                    elif task['index'] == task_choice and not task['completed']:
-                        edit_menu(task_choice, curr_user)
-                        break         
-
-def edit_menu(task_choice, curr_user):
+            if days >= 1:
+                break
+            print("Invalid number of days. Please enter 1 or more.")
+    # The due date index finds the tasks due soon without reading every task
+    due_tasks = storage.tasks_due_within(days, date.today().toordinal())
+    for task in due_tasks:
+        display_task(task)
+    print(f"\n{len(due_tasks)} task(s) due within {days} day(s).")
+
+def edit_screen(curr_user, task_choice):
     '''Present the EDIT MENU to the user'''
-    while True:
-        # User input converted to lower case for handling incorrect capitalisation
-        edit_choice =  input("""\nEDIT MENU
+    # User input converted to lower case for handling incorrect capitalisation
+    edit_choice =  input("""\nEDIT MENU
 Select one of the following Edit Options below:
 tc - Mark task as complete
 ua - Edit user assigned to task
 dd - Edit task due date                     
 ex - Exit to Main Menu
 : """).lower()
-        # Run edit completed function
-        if edit_choice == "tc":
-            edit_completed(task_choice, curr_user)        
-        # Run edit assigned user function
-        elif edit_choice == "ua":
-            edit_assigneduser(task_choice, curr_user)
-        # Run edit due date function
-        elif edit_choice == "dd":
-            edit_duedate(task_choice, curr_user)
-        # Exit to MAIN MENU
-        elif edit_choice == "ex":
-            print("\nReturning to MAIN MENU...")
-            break
-        # Error handling for invalid user input
-        else:
-            print("You made an invalid choice, Please Try again")
+    # Go back to choosing a task
+    if edit_choice == "ex":
+        print("\nReturning to MAIN MENU...")
+        return select_task_screen, None
+    option = EDIT_MENU_OPTIONS.get(edit_choice)
+    # Error handling for invalid user input
+    if option is None:
+        print("You made an invalid choice, Please Try again")
+        return edit_screen, task_choice
+    # Run the chosen edit function, which returns the next screen
+    return option(task_choice, curr_user)
 
 def edit_completed(task_choice, curr_user):
     '''Enable user to change the completion status of a task'''
-    # loop to update completion status of selected task in full task list
-    updated_tasks = []
-    for task in read_tasks(): 
-        # Find task selected for editing
-        if task['index'] == task_choice:
-            # Update task to 'complete'
-            task['completed'] = True
-            print(f"\nTask marked as complete...")
-            display_task(task)
-        # Append each task to the updated task list
-        updated_tasks.append(task)
-    # Update the task file with the updated task list
-    write_tasks(updated_tasks)
+    # Find task selected for editing and remember the values the user saw
+    task = storage.get(task_choice)
+    # Another session may have archived the task since it was chosen
+    if task is None:
+        return task_missing(task_choice)
+    expected = task.fields()
+    # Update task to 'complete', which only appends a record to the change log
+    try:
+        task = storage.set_completed(task_choice, expected=expected)
+    # Error handling for a task changed by another session in the meantime
+    except TaskConflictError:
+        return show_conflict(task_choice)
+    else:
+        print(f"\nTask marked as complete...")
+        display_task(task)
+        print("Task file successfully updated.")
     # Return user to MAIN MENU as the user cannot edit a completed task
-    main_menu(curr_user)
+    return main_screen, None
 
 def edit_assigneduser(task_choice, curr_user):
     '''Enable user to change the user assigned to a task'''
-    # Read user.txt file to return dictionary of usernames and passwords
-    username_password = read_userfile()
-    # Loop to update assigned user of selected task in full task list
-    updated_tasks = []
-    for task in read_tasks():
-        # Find task selected for editing
-        if task['index'] == task_choice:
-            # Show task to user before edit
-            print(f"\nTask before assigned user update:")
-            display_task(task)    
-            # Error handling to ensure assigned username exists
-            new_taskuser = input("Name of person to reassign task to: ")
-            while new_taskuser not in username_password.keys():
-                print("User does not exist. Please enter a valid username")
-                new_taskuser = input("Name of person assigned to task: ")
-            task["username"] = new_taskuser 
-            # Show task to user after edit
-            print(f"\nTask after assigned user update:")
-            display_task(task)
-        # Append each task to the updated task list
-        updated_tasks.append(task)
-    # Update the task file with the updated task list
-    write_tasks(updated_tasks)
+    # Find task selected for editing and remember the values the user saw
+    task = storage.get(task_choice)
+    # Another session may have archived the task since it was chosen
+    if task is None:
+        return task_missing(task_choice)
+    expected = task.fields()
+    # Show task to user before edit
+    print(f"\nTask before assigned user update:")
+    display_task(task)
+    # Error handling to ensure assigned username exists
+    new_taskuser = input("Name of person to reassign task to: ")
+    while not storage.has_user(new_taskuser):
+        print("User does not exist. Please enter a valid username")
+        new_taskuser = input("Name of person assigned to task: ")
+    try:
+        task = storage.reassign(task_choice, new_taskuser, expected=expected)
+    # Error handling for a task changed by another session in the meantime
+    except TaskConflictError:
+        return show_conflict(task_choice)
+    else:
+        # Show task to user after edit
+        print(f"\nTask after assigned user update:")
+        display_task(task)
+        print("Task file successfully updated.")
     # Return user to MAIN MENU so the user cannot edit another user's task
-    main_menu(curr_user)
+    return main_screen, None
 
 def edit_duedate(task_choice, curr_user):
     '''Enable user to change the due date of a task'''
-    # Loop to update task due date of selected task in full task list
-    updated_tasks = []
-    for task in read_tasks():
-        # Find task selected for editing
-        if task['index'] == task_choice:
-            # Show task to user before edit
-            print(f"\nTask before due date update:")
-            display_task(task)
-            # Error handling to ensure user enters a date in the correct format
-            while True:
-                try:
-                    new_duedate = input("New due date of task (YYYY-MM-DD): ")
-                    due_date_time = datetime.strptime(new_duedate, DATETIME_STRING_FORMAT)
-                    break
-                except ValueError:
-                    print("Invalid datetime format. Please use the format specified")
-            task["due_date"] = due_date_time  
-            # Show task to user after edit
-            print(f"\nTask after due date update:")
-            display_task(task)
-        # Append each task to the updated task list
-        updated_tasks.append(task)
-    # Update the task file with the updated task list
-    write_tasks(updated_tasks)
+    # Find task selected for editing and remember the values the user saw
+    task = storage.get(task_choice)
+    # Another session may have archived the task since it was chosen
+    if task is None:
+        return task_missing(task_choice)
+    expected = task.fields()
+    # Show task to user before edit
+    print(f"\nTask before due date update:")
+    display_task(task)
+    # Error handling to ensure user enters a date in the correct format
+    while True:
+        try:
+            new_duedate = input("New due date of task (YYYY-MM-DD): ")
+            due_date_time = parse_date(new_duedate)
+            break
+        except ValueError:
+            print("Invalid datetime format. Please use the format specified")
+    try:
+        task = storage.set_due_date(task_choice, due_date_time, expected=expected)
+    # Error handling for a task changed by another session in the meantime
+    except TaskConflictError:
+        return show_conflict(task_choice)
+    else:
+        # Show task to user after edit
+        print(f"\nTask after due date update:")
+        display_task(task)
+        print("Task file successfully updated.")
     # Return user to MAIN MENU as the user cannot edit a completed task
-    main_menu(curr_user)
+    return main_screen, None
+
+def show_conflict(task_choice):
+    '''Tells the user their edit was not saved because another session
+        changed the task first, shows the task as it is now and returns
+        the next screen
+    '''
+    print(f"\nTask {task_choice} was changed in another session, so your edit was not saved.")
+    task = storage.get(task_choice)
+    # The other session may have archived the task
+    if task is None:
+        return task_missing(task_choice)
+    print("The task is now:")
+    display_task(task)
+    return main_screen, None
+
+def task_missing(task_choice):
+    '''Tells the user a task no longer exists and returns them to choosing
+        another task
+    '''
+    print(f"\nTask {task_choice} no longer exists, it may have been archived by another session.")
+    return select_task_screen, None
 
 def generate_reports():
     '''Generate a task report & a user report and saves them to two text files.'''
-    # Section to create the task_overview.txt file
-    with open("task_overview.txt", "w") as taskoverview_file:
-        # Create a task list variable from the task list file
-        task_dict = read_tasks()
-        # Initialises counts and percentages as zero
-        count_complete = 0
-        count_incomplete = 0
-        count_overdue = 0
-        per_incomplete = 0
-        per_overdue  = 0
-        # loop to increment task count variables for specified conditions
-        for task in task_dict:
-            if task['completed'] == True:
-                count_complete += 1
-            else:
-                if task['due_date'] < datetime.today():
-                    count_overdue += 1
-                    count_incomplete += 1
-                else:
-                    count_incomplete += 1
-        # Calculate percentages with zero division error handling
-        if len(task_dict) != 0:
-            per_incomplete = 100 * count_incomplete / len(task_dict)
-            per_overdue = 100 * count_overdue / len(task_dict)
-        # Create string of task stats to be written to the task_overview.txt file in a readable format
-        task_str = f"=======================TASK OVERVIEW=======================\n"
-        task_str += f"Total number of tasks:      \t{len(task_dict)}\n"
-        task_str += f"Number of completed tasks:  \t{count_complete}\n"
-        task_str += f"Number of uncompleted tasks:\t{count_incomplete}\t {per_incomplete:.2f}% of total tasks\n"
-        task_str += f"Number of overdue tasks:    \t{count_overdue}\t {per_overdue:.2f}% of total tasks\n"
-        taskoverview_file.write(task_str)
+    # Count the tasks and write task_overview.txt and user_overview.txt
+    count_tasks, user_counts = report(storage)
     # Notify user that the updates to the task_overview.txt file are complete
     print(f"\nTask Overview file successfully updated.")
-    # Section to create the user_overview.txt file
-    with open("user_overview.txt", "w") as useroverview_file:
-        # Read user.txt file to return dictionary of usernames and passwords
-        username_password = read_userfile()
-        # Create and append header rows for user_overview.txt in a readable format
-        user_str = f"=======================USER OVERVIEW=======================\n"
-        user_str += f"Total number of users:\t{len(username_password)}\n"
-        user_str += f"Total number of tasks:\t{len(task_dict)}\n"
-        useroverview_file.write(user_str)
-        # loop to calculate stats for each user
-        for k in username_password.keys():
-            # Initialises counts and percentages as zero
-            count_user_tasks = 0
-            count_user_tasks_complete = 0
-            count_user_tasks_incomplete = 0
-            count_user_tasks_overdue = 0
-            per_user_tasks = 0
-            per_user_tasks_complete = 0
-            per_user_tasks_incomplete = 0
-            per_user_overdue = 0
-            # loop to increment count variables for specified conditions
-            for task in task_dict:
-                if task['username'] ==  k and task['completed'] == True:
-                    count_complete += 1
-                    count_user_tasks += 1
-                    count_user_tasks_complete += 1
-                elif task['username'] ==  k and task['due_date'] < datetime.today():
-                    count_overdue += 1
-                    count_incomplete += 1
-                    count_user_tasks += 1
-                    count_user_tasks_overdue += 1
-                    count_user_tasks_incomplete += 1
-                elif task['username'] ==  k:
-                    count_incomplete += 1
-                    count_user_tasks += 1
-                    count_user_tasks_incomplete += 1
-                # Calculate percentages with zero division error handling
-                if len(task_dict) != 0:
-                    per_user_tasks = 100 * count_user_tasks / len(task_dict)
-                if count_user_tasks != 0:
-                    per_user_tasks_complete = 100 * count_user_tasks_complete / count_user_tasks
-                    per_user_tasks_incomplete = 100 * count_user_tasks_incomplete / count_user_tasks
-                    per_user_overdue = 100 * count_user_tasks_overdue / count_user_tasks
-            # Create string of stats for a user to be appended to the user_overview.txt file in a readable format
-            user_str = f"\nUser: {k}\n"
-            user_str += f"Total number of tasks:     \t{count_user_tasks}\t {per_user_tasks:.2f}% of total tasks\n"
-            user_str += f"Number of complete tasks:  \t{count_user_tasks_complete}\t {per_user_tasks_complete:.2f}% of total user tasks\n"
-            user_str += f"Number of incomplete tasks:\t{count_user_tasks_incomplete}\t {per_user_tasks_incomplete:.2f}% of total user tasks\n"
-            user_str += f"Number of overdue tasks:   \t{count_user_tasks_overdue}\t {per_user_overdue:.2f}% of total user tasks\n"
-            useroverview_file.write(user_str)
-            # Notify user that the stats of a user have been appended to the user_overview.txt file
-            print(f"User Overview file successfully updated for {k}.")
+    # Notify user that the stats of each user have been written to the user_overview.txt file
+    for k in user_counts:
+        print(f"User Overview file successfully updated for {k}.")
     # Notify user that the updates to the user_overview.txt file are complete
     print(f"User Overview file update completed successfully.\n")
 
 def display_stats():
     '''Displays task and user statistics on screen (for admin user only)'''
-    # Create task and user overview report files in case they have not already been created 
-    generate_reports()
-    # Read task_overview.txt file to print task overview report
-    with open("task_overview.txt", "r") as taskoverview_file:
-        print(taskoverview_file.read())
-    # Read user_overview.txt file to print user overview report
-    with open("user_overview.txt", "r") as useroverview_file:
-        print(useroverview_file.read()) 
+    # Read user.txt file to return dictionary of usernames and passwords
+    username_password = read_userfile()
+    # Use the running task statistics rather than counting every task again
+    stats = storage.get_stats()
+    today_ordinal = date.today().toordinal()
+    count_tasks, count_complete, count_overdue = stats.totals(today_ordinal)
+    # Print the task overview report
+    print(format_task_overview(count_tasks, count_complete, count_overdue))
+    # Print the user overview report
+    user_str = format_user_overview_header(len(username_password), count_tasks)
+    for k in username_password:
+        user_str += format_user_overview(k, stats.user_counts(k, today_ordinal), count_tasks)
+    print(user_str)
 
 def read_userfile():
-    '''Read user.txt file and create a dictionary of usernames and passwords.'''
-    # Create a username_password dictionary from the user.txt file.
-    with open("user.txt", "r") as user_file:
-        user_data = user_file.read().split("\n")
-        username_password = {}
-        for user in user_data:
-            username, password = user.split(';')
-            username_password[username] = password
-        return username_password
-
-def read_tasks():
-    '''Creates an indexed task list from the task file'''
-    # Read in task data from the task.txt file
-    with open("tasks.txt", 'r') as task_file:
-        task_data = task_file.read().split("\n")
-        task_data = [t for t in task_data if t != ""]
-    # Create an indexed task list from task data
-    task_list = []
-    for index, t_str in enumerate(task_data,1):
-        curr_t = {}
-        # Split by semicolon and manually add each component
-        task_components = t_str.split(";")
-        curr_t['index'] = index
-        curr_t['username'] = task_components[0]
-        curr_t['title'] = task_components[1]
-        curr_t['description'] = task_components[2]
-        curr_t['due_date'] = datetime.strptime(task_components[3], DATETIME_STRING_FORMAT)
-        curr_t['assigned_date'] = datetime.strptime(task_components[4], DATETIME_STRING_FORMAT)
-        curr_t['completed'] = True if task_components[5] == "Yes" else False
-        task_list.append(curr_t)
-    return task_list
+    '''Returns the dictionary of usernames and passwords from user.txt'''
+    # The user store only reads the file again if it has changed
+    return storage.users()
+
+def iter_tasks():
+    '''Yields the tasks one at a time in task id order'''
+    # Streams the task file unless the task list is already in memory
+    return storage.iter_tasks()
 
 def display_task(task):
     '''Prints the tasks to the console'''
-    # Create string of stats that can be printed to the console in a readable format
-    disp_str = f"Task#: \t\t {task['index']}\n"
-    disp_str += f"Task: \t\t {task['title']}\n"
-    disp_str += f"Assigned to: \t {task['username']}\n"
-    disp_str += f"Date Assigned: \t {task['assigned_date'].strftime(DATETIME_STRING_FORMAT)}\n"
-    disp_str += f"Due Date: \t {task['due_date'].strftime(DATETIME_STRING_FORMAT)}\n"
-    disp_str += f"Task Complete? \t {'Yes' if task['completed'] else 'No'}\n"
-    disp_str += f"Task Description: \n {task['description']}\n"
-    print(f"{'_' * 60}\n{disp_str}")
-
-def write_tasks(updated_tasks):
-    '''Writes the updated task list to the task file'''
-    # Open the task file and repopulate with the updated task list
-    with open("tasks.txt", "w") as task_file:
-        # Convert indexed task list back to a semicolon separated task format
-        task_list_to_write = []
-        for t in updated_tasks:
-            str_attrs = [
-                t['username'],
-                t['title'],
-                t['description'],
-                t['due_date'].strftime(DATETIME_STRING_FORMAT),
-                t['assigned_date'].strftime(DATETIME_STRING_FORMAT),
-                "Yes" if t['completed'] else "No"
-            ]
-            task_list_to_write.append(";".join(str_attrs))
-        # Write each semicolon separated task to the task file
-        task_file.write("\n".join(task_list_to_write))
-    print("Task file successfully updated.")
+    # Format the task with the shared task template in a readable format
+    sys.stdout.write(render_task(task))
+
+
+# MAIN MENU options and the function each runs, which may return the next
+# screen to show
+MAIN_MENU_OPTIONS = {
+    'ru': lambda curr_user: reg_user(),
+    'at': lambda curr_user: add_task(),
+    'va': lambda curr_user: view_all(),
+    'vp': lambda curr_user: view_pages(),
+    'wf': lambda curr_user: export_tasks(),
+    'vm': view_mine,
+    'od': lambda curr_user: view_overdue(),
+    'dw': lambda curr_user: view_due_within(),
+    'gr': lambda curr_user: generate_reports(),
+    'ds': lambda curr_user: display_stats(),
+    'ex': lambda curr_user: exit_program(),
+}
+
+# MAIN MENU options only the admin user can run
+ADMIN_OPTIONS = {'ds'}
+
+# EDIT MENU options and the edit function each runs
+EDIT_MENU_OPTIONS = {
+    'tc': edit_completed,
+    'ua': edit_assigneduser,
+    'dd': edit_duedate,
+}
 
 
 # Run the main program function
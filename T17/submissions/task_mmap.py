@@ -0,0 +1,249 @@
+"""
+==================================TASK MMAP==================================
+This module reads single tasks out of tasks.txt without reading the rest
+of the file. The file is memory mapped, and a line offset index gives the
+position and id of every task line:
+- offsets: the byte position where each task line starts, in an array('q')
+- ids:     the task id on each line, in an array('q'), in ascending order
+so a task is found by a binary search of the ids and read with one slice.
+
+The index is saved next to the task file (tasks.txt.idx) along with the
+inode, size and modification time of the task file it was built from, so
+later runs load it instead of scanning the file again, and it is only
+rebuilt once the task file has changed. Reads do not take the write lock,
+so each opened file is checked against the index and read again with a
+new index if another session has replaced it in the meantime.
+
+Snapshot lines end with a fixed width completion field ("Yes" or "No "),
+so a task can be marked complete by overwriting those three bytes in
+place. Lines from older files ending in "No" cannot be patched and are
+left for the change log.
+"""
+
+# Import libraries
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
+from task_record import parse_task, COMPLETED_FIELDS, TASK_FILE_HEADER
+from task_files import write_atomic, file_state
+
+# Layout of the index file header: a marker, the inode, size and
+# modification time of the task file, and the number of task lines
+INDEX_HEADER = struct.Struct("<4sqqqq")
+INDEX_MARKER = b"TIDX"
+
+# Header line of task files in the escaped format, which is not a task
+HEADER_LINE = TASK_FILE_HEADER.encode("utf-8")
+
+# Width of the completion field at the end of a snapshot line, and the
+# saved fields that can be overwritten in place
+COMPLETED_WIDTH = 3
+PATCHABLE_FIELDS = [field.encode("ascii") for field in COMPLETED_FIELDS.values()]
+
+
+class TaskFileMap:
+    '''Random access to the task lines of a task file by task id'''
+
+    def __init__(self, task_path, index_path=None):
+        self.task_path = task_path
+        self.index_path = index_path or task_path + ".idx"
+        self.offsets = array('q')
+        self.ids = array('q')
+        # Inode, size and modification time of the task file the index is for,
+        # and whether the file is in the escaped format
+        self.state = None
+        self.escaped = False
+
+    def refresh(self):
+        '''Makes sure the index matches the task file, loading the saved
+            index or building and saving a new one if it does not
+        '''
+        state = file_state(self.task_path)
+        if state == self.state:
+            return self
+        if state is not None and not self._load_index(state):
+            self._build_index()
+            self._save_index(state)
+        elif state is None:
+            self.offsets = array('q')
+            self.ids = array('q')
+        self.escaped = state is not None and self._has_header()
+        self.state = state
+        return self
+
+    def __len__(self):
+        self.refresh()
+        return len(self.ids)
+
+    def row_of(self, task_id):
+        '''Returns the line number (from 0) of a task, or None'''
+        self.refresh()
+        row = bisect_left(self.ids, task_id)
+        if row < len(self.ids) and self.ids[row] == task_id:
+            return row
+        return None
+
+    def find(self, task_id):
+        '''Returns the task with the given id as saved in the task file, or
+            None if the task file does not have it
+        '''
+        with self._open_map() as task_map:
+            row = bisect_left(self.ids, task_id)
+            if task_map is None or row == len(self.ids) or self.ids[row] != task_id:
+                return None
+            return self._task(task_map, row)
+
+    def tasks_at(self, rows):
+        '''Returns the tasks on the given line numbers (from 0)'''
+        rows = list(rows)
+        if not rows:
+            return []
+        with self._open_map() as task_map:
+            if task_map is None:
+                return []
+            # Rows past the end are skipped if the file has been rewritten
+            # with fewer lines since they were chosen
+            return [self._task(task_map, row) for row in rows if row < len(self.offsets)]
+
+    @contextmanager
+    def _open_map(self):
+        '''Memory maps the task file the index was built from, or yields
+            None if the task file is missing or empty. Readers do not take
+            the write lock, so another session may replace the task file
+            between refreshing the index and opening the file. The open
+            file is checked against the index and, if it is a newer file,
+            the index is refreshed and the file opened again.
+        '''
+        while True:
+            self.refresh()
+            try:
+                task_file = open(self.task_path, "rb")
+            except FileNotFoundError:
+                if self.state is None:
+                    yield None
+                    return
+                continue
+            with task_file:
+                if file_state(task_file.fileno()) != self.state:
+                    continue
+                if self.state[1] == 0:
+                    yield None
+                    return
+                with mmap.mmap(task_file.fileno(), 0, access=mmap.ACCESS_READ) as task_map:
+                    yield task_map
+                    return
+
+    def _task(self, task_map, row):
+        '''Parses the task on a line number (from 0) of the mapped file'''
+        t_str = self._line(task_map, row).decode("utf-8")
+        return parse_task(t_str, row + 1, self.escaped)
+
+    def patch_completed(self, task_id, completed):
+        '''Overwrites the completion field of a task in place, returning
+            False if the task is missing or its line has no fixed width field
+        '''
+        row = self.row_of(task_id)
+        if row is None:
+            return False
+        old_state = self.state
+        with open(self.task_path, "r+b") as task_file:
+            with mmap.mmap(task_file.fileno(), 0) as task_map:
+                line = self._line(task_map, row)
+                field = line[-COMPLETED_WIDTH - 1:]
+                if field[:1] != b";" or field[1:] not in PATCHABLE_FIELDS:
+                    return False
+                end = self.offsets[row] + len(line)
+                task_map[end - COMPLETED_WIDTH:end] = COMPLETED_FIELDS[completed].encode("ascii")
+                task_map.flush()
+        # Other sessions notice the change by the modification time, so make
+        # sure it moves even if the clock has not ticked since the last write
+        state = file_state(self.task_path)
+        if state == old_state:
+            os.utime(self.task_path, ns=(state[2], state[2] + 1))
+            state = file_state(self.task_path)
+        # The line offsets have not moved, so only the saved file state in
+        # the index header needs changing
+        self.state = state
+        self._save_header(state)
+        return True
+
+    def _line(self, task_map, row):
+        '''Returns a task line without its line ending'''
+        start = self.offsets[row]
+        end = task_map.find(b"\n", start)
+        if end == -1:
+            end = len(task_map)
+        return task_map[start:end].rstrip(b"\r")
+
+    def _has_header(self):
+        '''Returns True if the task file starts with the escaped format header'''
+        with open(self.task_path, "rb") as task_file:
+            return task_file.readline().rstrip(b"\r\n") == HEADER_LINE
+
+    def _build_index(self):
+        '''Scans the task file for the start and task id of each line'''
+        self.offsets = array('q')
+        self.ids = array('q')
+        if os.path.getsize(self.task_path) == 0:
+            return
+        with open(self.task_path, "rb") as task_file:
+            with mmap.mmap(task_file.fileno(), 0, access=mmap.ACCESS_READ) as task_map:
+                size = len(task_map)
+                start = 0
+                while start < size:
+                    end = task_map.find(b"\n", start)
+                    if end == -1:
+                        end = size
+                    line = task_map[start:end].rstrip(b"\r")
+                    if line != b"" and not (start == 0 and line == HEADER_LINE):
+                        self.offsets.append(start)
+                        # Lines saved without an id are numbered by line
+                        if line.count(b";") == 6:
+                            self.ids.append(int(line[:line.index(b";")]))
+                        else:
+                            self.ids.append(len(self.ids) + 1)
+                    start = end + 1
+
+    def _load_index(self, state):
+        '''Loads the saved index if it was built from the task file as it is
+            now, returning False if it was not
+        '''
+        try:
+            with open(self.index_path, "rb") as index_file:
+                header = index_file.read(INDEX_HEADER.size)
+                if len(header) != INDEX_HEADER.size:
+                    return False
+                marker, inode, size, mtime_ns, count = INDEX_HEADER.unpack(header)
+                if marker != INDEX_MARKER or [inode, size, mtime_ns] != state:
+                    return False
+                offsets = array('q')
+                ids = array('q')
+                offsets.fromfile(index_file, count)
+                ids.fromfile(index_file, count)
+        except (FileNotFoundError, EOFError):
+            return False
+        self.offsets = offsets
+        self.ids = ids
+        return True
+
+    def _save_header(self, state):
+        '''Overwrites the task file state in the header of the saved index'''
+        try:
+            with open(self.index_path, "r+b") as index_file:
+                index_file.write(INDEX_HEADER.pack(INDEX_MARKER, *state, len(self.ids)))
+        # Without a saved index there is nothing to update
+        except FileNotFoundError:
+            pass
+
+    def _save_index(self, state):
+        '''Saves the index next to the task file, replacing it in one step'''
+        data = INDEX_HEADER.pack(INDEX_MARKER, *state, len(self.ids))
+        try:
+            write_atomic(self.index_path, data + self.offsets.tobytes() + self.ids.tobytes())
+        # The index is only a cache, so a folder that cannot be written to
+        # just means it is built again next time
+        except OSError:
+            pass
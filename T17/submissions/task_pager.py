@@ -0,0 +1,103 @@
+"""
+=================================TASK PAGER=================================
+This module shows the tasks in tasks.txt one page at a time without
+reading the whole task list into memory. Pages are read through the line
+offset index of the snapshot file (see task_mmap.py), which gives the
+position and task id of every task line and is saved between runs, so a
+Task# is found with a binary search of the ids. The change log (tasks.log)
+is read when the index is checked, so each page has the latest edits
+applied and tasks added since the snapshot come last.
+
+A page only reads and parses its own lines, so showing a page takes the
+same time however many tasks there are. The change log is read again
+whenever the task files change (see TaskStore.signature).
+"""
+
+# Import libraries
+from bisect import bisect_left
+from task_record import apply_changes
+
+# Number of tasks shown on each page unless another size is chosen
+PAGE_SIZE = 10
+
+
+class TaskPager:
+    '''Splits the tasks of a task store (see task_store.py) into pages'''
+
+    def __init__(self, store, page_size=PAGE_SIZE):
+        self.store = store
+        self.page_size = page_size
+        # Task id of every task line in the snapshot file, from its index
+        self.ids = []
+        # Logged changes by task id, and the tasks added since the snapshot
+        # was written in task id order
+        self.pending = {}
+        self.added = []
+        # Signature of the task files the index was built from
+        self.signature = None
+
+    def refresh(self):
+        '''Builds the index again if the task files have changed'''
+        signature = self.store.signature()
+        if signature != self.signature:
+            self._build()
+            self.signature = signature
+        return self
+
+    def _build(self):
+        '''Brings the snapshot file index up to date and reads the change log'''
+        self.ids = self.store.file_map.refresh().ids
+        self.pending = self.store.pending_changes()
+        # Tasks added to the log that are not in the snapshot come last
+        self.added = []
+        for task_id in sorted(self.pending):
+            if not self._in_snapshot(task_id):
+                task = apply_changes(None, self.pending[task_id])
+                if task is not None:
+                    self.added.append(task)
+
+    def _in_snapshot(self, task_id):
+        '''Returns True if the snapshot file has a line for the task id'''
+        row = bisect_left(self.ids, task_id)
+        return row < len(self.ids) and self.ids[row] == task_id
+
+    def __len__(self):
+        self.refresh()
+        return len(self.ids) + len(self.added)
+
+    def page_count(self):
+        '''Returns the number of pages, which is at least one'''
+        return max(1, -(-len(self) // self.page_size))
+
+    def page(self, number):
+        '''Returns the tasks on a page, numbered from 1, parsing only the
+            snapshot lines on that page
+        '''
+        self.refresh()
+        first_row = (number - 1) * self.page_size
+        last_row = min(first_row + self.page_size, len(self))
+        tasks = []
+        snapshot_rows = range(first_row, min(last_row, len(self.ids)))
+        for task in self.store.file_map.tasks_at(snapshot_rows):
+            task = apply_changes(task, self.pending.get(task.id, ()))
+            if task is not None:
+                tasks.append(task)
+        # Any rows past the snapshot are tasks added since it was written
+        for row in range(max(first_row, len(self.ids)), last_row):
+            tasks.append(self.added[row - len(self.ids)])
+        return tasks
+
+    def page_of(self, task_id):
+        '''Returns the number of the page showing a task, or None if there is
+            no task with that id
+        '''
+        self.refresh()
+        if self._in_snapshot(task_id):
+            row = bisect_left(self.ids, task_id)
+        else:
+            added_ids = [task.id for task in self.added]
+            row = bisect_left(added_ids, task_id)
+            if row == len(added_ids) or added_ids[row] != task_id:
+                return None
+            row += len(self.ids)
+        return row // self.page_size + 1
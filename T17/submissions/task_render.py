@@ -0,0 +1,68 @@
+"""
+================================TASK RENDER================================
+This module turns tasks into the text shown by the Task Manager and writes
+it out in large batches:
+- every task is formatted with one TASK_TEMPLATE string using % formatting
+(the quickest way Python has to fill in a template), instead of a string
+being built up piece by piece for each task
+- the formatted tasks are joined into chunks of RENDER_BATCH tasks and
+each chunk is passed to a single write call, so showing 100,000 tasks
+makes a few hundred writes rather than one print per task
+
+The output can go to the console or to any open file, such as a text file
+or a pipe to another program.
+"""
+
+# Import libraries
+import sys
+from task_record import format_ordinal
+
+# Number of tasks formatted and written together in one write call
+RENDER_BATCH = 500
+
+# Text shown for each task, the same as display_task has always printed
+TASK_TEMPLATE = (
+    "____________________________________________________________\n"
+    "Task#: \t\t %d\n"
+    "Task: \t\t %s\n"
+    "Assigned to: \t %s\n"
+    "Date Assigned: \t %s\n"
+    "Due Date: \t %s\n"
+    "Task Complete? \t %s\n"
+    "Task Description: \n %s\n"
+    "\n"
+)
+
+
+def render_task(task):
+    '''Returns the text shown for a single task'''
+    return TASK_TEMPLATE % (
+        task.id,
+        task.title,
+        task.username,
+        format_ordinal(task.assigned),
+        format_ordinal(task.due),
+        "Yes" if task.completed else "No",
+        task.description
+    )
+
+
+def write_rendered(tasks, out=None, batch_size=RENDER_BATCH):
+    '''Writes the text of any iterable of tasks to an open file (the
+        console by default) a batch at a time, and returns how many tasks
+        were written
+    '''
+    out = out or sys.stdout
+    count = 0
+    chunk = []
+    for task in tasks:
+        chunk.append(render_task(task))
+        if len(chunk) == batch_size:
+            out.write("".join(chunk))
+            count += len(chunk)
+            chunk = []
+    if chunk:
+        out.write("".join(chunk))
+        count += len(chunk)
+    out.flush()
+    return count
@@ -0,0 +1,349 @@
+"""
+================================TASK SERVER================================
+This module runs the Task Manager as a server, so many users can work on
+the same tasks at once instead of each running their own input() loop.
+Clients connect over TCP (or a Unix socket) and send one JSON object per
+line, and the server answers each with one JSON object per line:
+    {"op": "login", "username": "admin", "password": "password"}
+    {"ok": true, "result": "admin"}
+    {"op": "bogus"}
+    {"ok": false, "error": "Unknown operation 'bogus'"}
+Any "id" sent with a request is sent back with its answer.
+
+The operations match the menus (see OPERATIONS), and a client must log in
+before anything else. Users can only edit their own tasks and only the
+admin user can see the statistics, as in the menus.
+
+The server handles every client in one asyncio event loop:
+- reads are answered straight away from the storage backend, which for
+the text backend means the tasks and indexes it keeps in memory
+- writes are put on a queue and carried out one at a time by a single
+writer coroutine, so writes never interleave and each sees the result of
+the one before, while reads carry on between them
+
+Run the server with:
+    python task_server.py [--host HOST] [--port PORT] [--unix PATH]
+"""
+
+# Import libraries
+import argparse
+import asyncio
+import json
+import signal
+import traceback
+from datetime import date
+import task_api
+from credentials import Credentials
+from task_record import format_ordinal
+from task_store import TaskConflictError
+
+# Address the server listens on unless another is given
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Number of tasks returned by the "all" operation unless another page size
+# is asked for
+PAGE_SIZE = 100
+
+
+def task_to_dict(task):
+    '''Converts a Task to a dictionary that can be sent as JSON'''
+    return {
+        'id': task.id,
+        'username': task.username,
+        'title': task.title,
+        'description': task.description,
+        'due_date': format_ordinal(task.due),
+        'assigned_date': format_ordinal(task.assigned),
+        'completed': task.completed
+    }
+
+
+def number_field(request, name, default=None):
+    '''Returns a whole number field of a request, which may be sent as a
+        number or as text
+    '''
+    value = request[name] if default is None else request.get(name, default)
+    # true and false are numbers to Python but not to anyone sending them
+    if isinstance(value, (int, str)) and not isinstance(value, bool):
+        try:
+            return int(value)
+        except ValueError:
+            pass
+    raise ValueError(f"{name} must be a whole number")
+
+
+class TaskServer:
+    '''Answers line-delimited JSON requests from many clients at once'''
+
+    def __init__(self, storage=None):
+        self.storage = storage or task_api.default_storage()
+        self.credentials = Credentials(self.storage)
+        # Queue of (write function, future) pairs for the writer coroutine,
+        # created once the event loop is running
+        self.writes = None
+        self.writer_task = None
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_path=None):
+        '''Loads the tasks, starts the writer coroutine and listens for
+            clients
+        '''
+        # Load the tasks now, so reads are answered from memory from the
+        # first request instead of reading the task files until a write
+        self.storage.load()
+        self.writes = asyncio.Queue()
+        self.writer_task = asyncio.create_task(self._write_loop())
+        if unix_path is not None:
+            return await asyncio.start_unix_server(self._serve_client, unix_path)
+        return await asyncio.start_server(self._serve_client, host, port)
+
+    async def _write_loop(self):
+        '''Carries out the queued writes one at a time'''
+        while True:
+            write, future = await self.writes.get()
+            # A handler cancelled while its write waited no longer wants it,
+            # and setting the result of its future would stop the writer.
+            # Writes run without awaiting, so nothing is cancelled mid-write.
+            if future.cancelled():
+                continue
+            try:
+                result = write()
+            except Exception as error:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    async def write(self, write):
+        '''Queues a write function and waits for its result'''
+        future = asyncio.get_running_loop().create_future()
+        await self.writes.put((write, future))
+        return await future
+
+    async def _serve_client(self, reader, writer):
+        '''Answers the requests of one client until it disconnects'''
+        # Each connection is a session with its own logged in user, and the
+        # logins it has already verified
+        session = {'username': None, 'verified': {}}
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # The line is longer than the reader's limit, and the rest
+                    # of it cannot be told apart from the next request, so the
+                    # client is told why before its connection is closed
+                    response = {'ok': False, 'error': "Request line is too long"}
+                    writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                    await writer.drain()
+                    break
+                if not line:
+                    break
+                response = await self.handle(line, session)
+                writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle(self, line, session):
+        '''Answers a single request line, returning the response dictionary'''
+        request = {}
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("Requests must be JSON objects")
+            op = request.get('op')
+            # Only a string can name an operation, and other values such as
+            # lists cannot be looked up at all
+            operation = OPERATIONS.get(op) if isinstance(op, str) else None
+            if operation is None:
+                raise ValueError(f"Unknown operation '{op}'")
+            handler, is_write = operation
+            if op != 'login' and session['username'] is None:
+                raise ValueError("Please log in first")
+            if is_write:
+                result = await self.write(lambda: handler(self, session, request))
+            elif asyncio.iscoroutinefunction(handler):
+                result = await handler(self, session, request)
+            else:
+                result = handler(self, session, request)
+            response = {'ok': True, 'result': result}
+        except json.JSONDecodeError:
+            response = {'ok': False, 'error': "Requests must be one JSON object per line"}
+        except KeyError as error:
+            response = {'ok': False, 'error': f"Missing field '{error.args[0]}'"}
+        except (ValueError, TypeError, TaskConflictError) as error:
+            response = {'ok': False, 'error': str(error)}
+        # Any other error is a fault in the server, which is printed so it
+        # can be fixed but only fails this request, not the whole session
+        except Exception as error:
+            traceback.print_exc()
+            response = {'ok': False, 'error': f"Unexpected error: {error}"}
+        # Only an object has an id to echo, other JSON values are answered
+        # with the error above
+        if isinstance(request, dict) and 'id' in request:
+            response['id'] = request['id']
+        return response
+
+    def own_task(self, session, request):
+        '''Returns the requested task of the logged in user, which must still
+            be editable
+        '''
+        task_id = number_field(request, 'task_id')
+        task = task_api.editable_task(self.storage, task_id)
+        if task.username != session['username']:
+            raise ValueError(f"Task {task_id} is not assigned to you")
+        return task
+
+    async def op_login(self, session, request):
+        '''Logs the session in as a user, checking the password in the
+            credentials thread pool so other clients are not held up
+        '''
+        username = task_api.text_field(request, 'username')
+        password = task_api.text_field(request, 'password')
+        if not self.storage.has_user(username):
+            raise ValueError("User does not exist")
+        # A new hash of an outdated password is saved through the writer
+        if not await self.credentials.check_async(username, password, session['verified'],
+                                                  self.write):
+            raise ValueError("Wrong password")
+        session['username'] = username
+        return username
+
+    async def op_register(self, session, request):
+        '''Adds a new user, hashing the password in the credentials thread
+            pool and then queueing the write
+        '''
+        username = task_api.text_field(request, 'username')
+        password_hash = await self.credentials.hash_async(task_api.text_field(request, 'password'))
+        return await self.write(lambda: self._add_user(username, password_hash))
+
+    def _add_user(self, username, password_hash):
+        '''Adds a new user with an already hashed password'''
+        if self.storage.has_user(username):
+            raise ValueError("Username already exists")
+        self.storage.add_user(username, password_hash)
+        return username
+
+    def op_add(self, session, request):
+        '''Adds a task assigned to any existing user'''
+        task = task_api.add_task(task_api.text_field(request, 'username'),
+                                 task_api.text_field(request, 'title'),
+                                 task_api.text_field(request, 'description'),
+                                 request['due_date'], storage=self.storage)
+        return task_to_dict(task)
+
+    def op_all(self, session, request):
+        '''Returns a page of all the tasks, numbered from 1'''
+        page = number_field(request, 'page', 1)
+        page_size = number_field(request, 'page_size', PAGE_SIZE)
+        if page < 1 or page_size < 1:
+            raise ValueError("Pages and page sizes start at 1")
+        start = (page - 1) * page_size
+        return [task_to_dict(task) for task in self.storage.task_range(start, start + page_size)]
+
+    def op_get(self, session, request):
+        '''Returns a single task'''
+        return task_to_dict(task_api.existing_task(self.storage, number_field(request, 'task_id')))
+
+    def op_mine(self, session, request):
+        '''Returns the tasks of the logged in user'''
+        return [task_to_dict(task) for task in self.storage.tasks_for_user(session['username'])]
+
+    def op_overdue(self, session, request):
+        '''Returns the incomplete tasks due today or earlier'''
+        today_ordinal = date.today().toordinal()
+        return [task_to_dict(task) for task in self.storage.overdue_tasks(today_ordinal)]
+
+    def op_due_within(self, session, request):
+        '''Returns the incomplete tasks due within a number of days'''
+        days = number_field(request, 'days')
+        if days < 1:
+            raise ValueError("Invalid number of days. Please enter 1 or more.")
+        today_ordinal = date.today().toordinal()
+        return [task_to_dict(task) for task in self.storage.tasks_due_within(days, today_ordinal)]
+
+    def op_complete(self, session, request):
+        '''Marks one of the user's tasks as complete'''
+        task = self.own_task(session, request)
+        return task_to_dict(self.storage.set_completed(task.id))
+
+    def op_reassign(self, session, request):
+        '''Assigns one of the user's tasks to another user'''
+        task = self.own_task(session, request)
+        return task_to_dict(task_api.reassign(task.id, task_api.text_field(request, 'username'), self.storage))
+
+    def op_due(self, session, request):
+        '''Changes the due date of one of the user's tasks'''
+        task = self.own_task(session, request)
+        return task_to_dict(task_api.set_due_date(task.id, request['due_date'], self.storage))
+
+    def op_stats(self, session, request):
+        '''Returns the total and per user task counts (admin user only)'''
+        if session['username'] != 'admin':
+            raise ValueError("Only the admin user can display statistics")
+        count_tasks, user_counts = self.storage.report_counts(date.today().toordinal())
+        return {'tasks': count_tasks, 'users': user_counts}
+
+    def op_report(self, session, request):
+        '''Writes the task and user overview report files'''
+        count_tasks, user_counts = task_api.report(self.storage)
+        return {'tasks': count_tasks, 'users': len(user_counts)}
+
+
+# Operations by name, with the method answering each and whether it is
+# queued for the writer coroutine
+OPERATIONS = {
+    'login': (TaskServer.op_login, False),
+    'register': (TaskServer.op_register, False),
+    'add': (TaskServer.op_add, True),
+    'all': (TaskServer.op_all, False),
+    'get': (TaskServer.op_get, False),
+    'mine': (TaskServer.op_mine, False),
+    'overdue': (TaskServer.op_overdue, False),
+    'due_within': (TaskServer.op_due_within, False),
+    'complete': (TaskServer.op_complete, True),
+    'reassign': (TaskServer.op_reassign, True),
+    'due': (TaskServer.op_due, True),
+    'stats': (TaskServer.op_stats, False),
+    'report': (TaskServer.op_report, True),
+}
+
+
+async def serve(storage=None, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_path=None):
+    '''Runs a task server until it is cancelled, then saves all logged
+        changes to the task files
+    '''
+    task_server = TaskServer(storage)
+    server = await task_server.start(host, port, unix_path)
+    # Stop the same way on SIGTERM as on Ctrl+C, where the system allows it
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except NotImplementedError:
+        pass
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        task_server.storage.compact()
+
+
+def main(argv=None):
+    '''Runs the server on the address given on the command line'''
+    parser = argparse.ArgumentParser(description="Serve the Task Manager to many clients at once.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix", help="listen on this Unix socket path instead of TCP")
+    args = parser.parse_args(argv)
+    where = args.unix or f"{args.host}:{args.port}"
+    print(f"Task Manager server listening on {where}")
+    try:
+        asyncio.run(serve(host=args.host, port=args.port, unix_path=args.unix))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        print("\nTask Manager server stopped.")
+
+
+# Run the server on the address named on the command line
+if __name__ == "__main__":
+    main()
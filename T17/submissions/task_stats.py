@@ -0,0 +1,210 @@
+"""
+=================================TASK STATS=================================
+This module keeps running task statistics for every user so the Task
+Manager can display them without reading or counting every task:
+- total, complete and incomplete task counts are updated as tasks are
+added, completed and reassigned
+- the due dates of each user's incomplete tasks are kept in a sorted due
+date index, so the overdue count for any day is a binary search
+- a due date index of every incomplete task answers which tasks are
+overdue or due soon with a binary search plus one step per task found
+- archived tasks are added to the total and complete counts of their user
+from the archive aggregates
+- the statistics are saved to tasks_stats.json together with the inode,
+size and modification time of the snapshot (tasks.txt) they count, and a
+task completed in place in the snapshot is counted again in the saved file
+so it stays valid
+Once built, looking up the statistics takes time proportional to the number
+of users, but building them does not: the saved file holds the due date of
+every incomplete task, so loading it costs one step per incomplete task,
+plus one step per task changed in tasks.log, whose records are applied on
+top (see TaskStore.get_stats). Every task is only counted again when the
+snapshot no longer matches the saved file.
+"""
+
+# Import libraries
+import heapq
+import json
+import os
+from bisect import bisect_left, insort
+from task_files import write_atomic
+
+# Default file name for the saved statistics
+TASK_STATS_FILE = "tasks_stats.json"
+
+
+class DueIndex:
+    '''Sorted list of (due date ordinal, task id) pairs'''
+
+    def __init__(self, entries=None):
+        self.entries = sorted(entries) if entries else []
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, due_ordinal, task_id):
+        '''Adds a task to the index keeping the list sorted'''
+        insort(self.entries, (due_ordinal, task_id))
+
+    def remove(self, due_ordinal, task_id):
+        '''Removes a task from the index if it is present'''
+        i = bisect_left(self.entries, (due_ordinal, task_id))
+        if i < len(self.entries) and self.entries[i] == (due_ordinal, task_id):
+            del self.entries[i]
+
+    def count_before(self, ordinal):
+        '''Counts the tasks due before the given date ordinal'''
+        return bisect_left(self.entries, (ordinal,))
+
+    def ids_between(self, first_ordinal, last_ordinal):
+        '''Returns the ids of the tasks due from the first to the last date
+            ordinal (inclusive), in due date order
+        '''
+        start = bisect_left(self.entries, (first_ordinal,))
+        end = bisect_left(self.entries, (last_ordinal + 1,))
+        return [task_id for _, task_id in self.entries[start:end]]
+
+
+class UserStats:
+    '''Task counts and incomplete task due dates for a single user'''
+
+    def __init__(self, total=0, complete=0, due_entries=None):
+        self.total = total
+        self.complete = complete
+        self.incomplete_due = DueIndex(due_entries)
+
+    def counts(self, today_ordinal):
+        '''Returns the [total, complete, incomplete, overdue] task counts,
+            where tasks due today or earlier count as overdue
+        '''
+        overdue = self.incomplete_due.count_before(today_ordinal + 1)
+        return [self.total, self.complete, self.total - self.complete, overdue]
+
+
+class TaskStats:
+    '''Per user task statistics kept up to date as tasks change'''
+
+    def __init__(self):
+        self.users = {}
+        # Due date index of every incomplete task, built from the user
+        # indexes the first time it is needed
+        self.all_due = None
+
+    @classmethod
+    def from_tasks(cls, tasks):
+        '''Counts the statistics for a list of tasks'''
+        stats = cls()
+        due_entries = {}
+        for task in tasks:
+            user = stats._user(task.username)
+            user.total += 1
+            if task.completed:
+                user.complete += 1
+            else:
+                # Collect the due dates and sort each user's list once at the end
+                due_entries.setdefault(task.username, []).append((task.due, task.id))
+        for username, entries in due_entries.items():
+            stats.users[username].incomplete_due = DueIndex(entries)
+        return stats
+
+    def add_task(self, task):
+        '''Counts a task that has been added or has just been changed'''
+        user = self._user(task.username)
+        user.total += 1
+        if task.completed:
+            user.complete += 1
+        else:
+            user.incomplete_due.add(task.due, task.id)
+            if self.all_due is not None:
+                self.all_due.add(task.due, task.id)
+
+    def remove_task(self, task):
+        '''Stops counting a task, called before the task is changed'''
+        user = self._user(task.username)
+        user.total -= 1
+        if task.completed:
+            user.complete -= 1
+        else:
+            user.incomplete_due.remove(task.due, task.id)
+            if self.all_due is not None:
+                self.all_due.remove(task.due, task.id)
+
+    def add_archived(self, user_archived):
+        '''Counts archived tasks (see task_archive.py) from a dictionary of
+            username to number of archived tasks, which are all complete
+        '''
+        for username, count in user_archived.items():
+            user = self._user(username)
+            user.total += count
+            user.complete += count
+
+    def user_counts(self, username, today_ordinal):
+        '''Returns the [total, complete, incomplete, overdue] counts of a user'''
+        if username not in self.users:
+            return [0, 0, 0, 0]
+        return self.users[username].counts(today_ordinal)
+
+    def totals(self, today_ordinal):
+        '''Returns the total, complete and overdue counts across all users'''
+        count_tasks = 0
+        count_complete = 0
+        count_overdue = 0
+        for user in self.users.values():
+            total, complete, incomplete, overdue = user.counts(today_ordinal)
+            count_tasks += total
+            count_complete += complete
+            count_overdue += overdue
+        return count_tasks, count_complete, count_overdue
+
+    def incomplete_ids_due(self, first_ordinal, last_ordinal):
+        '''Returns the ids of the incomplete tasks due from the first to the
+            last date ordinal (inclusive), in due date order
+        '''
+        if self.all_due is None:
+            # Merge the already sorted user indexes into one sorted index
+            self.all_due = DueIndex()
+            self.all_due.entries = list(heapq.merge(
+                *(user.incomplete_due.entries for user in self.users.values())))
+        return self.all_due.ids_between(first_ordinal, last_ordinal)
+
+    def save(self, path, signature):
+        '''Saves the statistics along with the state of the task file they
+            count (see file_state)
+        '''
+        data = {
+            "signature": signature,
+            "users": {
+                username: [user.total, user.complete, user.incomplete_due.entries]
+                for username, user in self.users.items()
+            }
+        }
+        # Written through a temporary file so other sessions never read half a file
+        write_atomic(path, json.dumps(data))
+
+    @classmethod
+    def load(cls, path, signature):
+        '''Loads saved statistics, or returns None if they are missing or
+            were counted from a different task file
+        '''
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r") as stats_file:
+                data = json.load(stats_file)
+        except ValueError:
+            return None
+        if data.get("signature") != signature:
+            return None
+        stats = cls()
+        for username, (total, complete, entries) in data["users"].items():
+            # Entries were saved in sorted order so can be used as they are
+            user = UserStats(total, complete)
+            user.incomplete_due.entries = [tuple(entry) for entry in entries]
+            stats.users[username] = user
+        return stats
+
+    def _user(self, username):
+        '''Returns the statistics of a user, creating them if needed'''
+        if username not in self.users:
+            self.users[username] = UserStats()
+        return self.users[username]
@@ -0,0 +1,736 @@
+"""
+=================================TASK STORE=================================
+This module keeps the Task Manager task list in memory and saves changes to
+disk without rewriting the whole task file for every edit:
+- tasks.txt holds a snapshot of every task, one semicolon separated task
+per line after a "#tasks v2" header line:
+    <id>;<username>;<title>;<description>;<due>;<assigned>;<Yes/No >
+- tasks.log holds the changes made since the snapshot was written, one
+record per line after a "#log v2" header line:
+    add;<id>;<username>;<title>;<description>;<due>;<assigned>;<Yes/No >
+    update;<id>;completed;<Yes/No>
+    update;<id>;due_date;<YYYY-MM-DD>
+    reassign;<id>;<username>
+The change log, the saved statistics and the archive (see below) are
+named after the task file, so tasks.txt has tasks.log, tasks_stats.json
+and tasks_archive.json, and several task files can share a folder.
+Text fields are escaped so they can hold semicolons and new lines (see
+task_record.py). Files from before the headers were added are read
+without unescaping, and are replaced with the escaped format the next
+time they are written.
+
+The store also keeps per user task statistics (see task_stats.py) up to
+date as tasks change, and saves them each time the snapshot is rewritten
+or changed in place. Later sessions apply the change log to the saved
+statistics instead of counting every task.
+
+Every task has a permanent id which is stored in its record. New ids are
+always one more than the highest id ever used, so ids never change when
+the snapshot is rewritten. Task files written before ids were stored have
+no id field, and their tasks are numbered by line as they always were.
+
+Each edit appends a single record to tasks.log, so an edit costs the same
+regardless of how many tasks there are. The files are checked with os.stat
+before the in-memory list is used, so changes made by another Task Manager
+session are picked up: only the new end of the log is read when the log
+has grown, and everything is reloaded when the snapshot has been rewritten.
+Once the log holds COMPACT_THRESHOLD records (or when the program exits
+with any records in the log) the snapshot is rewritten from memory and the
+log is emptied, which is the only time tasks.txt is rewritten.
+
+Tasks are held as compact Task objects (see task_record.py).
+
+Whenever the snapshot is rewritten, tasks that were completed long enough
+ago are moved out of it into a compressed archive (see task_archive.py),
+whose aggregate counts are added to the statistics and reports, so the
+task list only holds the tasks still being worked on.
+
+Until the whole task list is needed, a single task is read straight from
+tasks.txt through a saved line offset index (see task_mmap.py), and
+marking a task complete overwrites its fixed width completion field in
+place instead of logging a record, so neither reads every task.
+
+Several Task Manager sessions can share the same task files safely:
+- every write happens while holding an fcntl lock on tasks.txt.lock, after
+first reading any records other sessions have added to the log, so task
+ids are never handed out twice and compaction never drops a record
+- the snapshot is rewritten to a temporary file which then replaces
+tasks.txt with os.replace, so readers always see a complete file
+- edits can pass the task fields they expect the task to have, and a
+TaskConflictError is raised instead of overwriting a change made by
+another session in the meantime
+On systems without fcntl (Windows) the lock is skipped.
+"""
+
+# Import libraries
+import os
+from contextlib import contextmanager
+from datetime import date
+from task_record import Task, parse_task, format_task, format_ordinal, parse_record, apply_changes
+from task_record import escape_field, TASK_FILE_HEADER, TASK_LOG_HEADER
+from task_stats import TaskStats
+from task_columns import TaskColumns
+from task_files import write_atomic, file_state
+from task_mmap import TaskFileMap
+from task_archive import TaskArchive, default_archive_days
+
+# Default file names for the task snapshot and the change log
+TASK_FILE = "tasks.txt"
+TASK_LOG_FILE = "tasks.log"
+
+# Endings added to the name of a task file, without its extension, to name
+# the change log, saved statistics and archive index kept beside it, so
+# tasks.txt has tasks.log, tasks_stats.json and tasks_archive.json
+TASK_LOG_SUFFIX = ".log"
+TASK_STATS_SUFFIX = "_stats.json"
+TASK_ARCHIVE_SUFFIX = "_archive.json"
+
+# fcntl is only available on Unix systems, elsewhere writes are not locked
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Number of change log records written before the snapshot is rewritten
+COMPACT_THRESHOLD = 1000
+
+
+def sidecar_path(task_path, suffix):
+    '''Returns the path of a file kept beside a task file and named after it'''
+    return os.path.splitext(task_path)[0] + suffix
+
+
+class TaskConflictError(Exception):
+    '''Raised when a task was changed by another session after it was read'''
+
+
+class TaskStore:
+    '''In-memory task list backed by a snapshot file and an append-only
+        change log, with an index of the tasks keyed by task id
+    '''
+
+    def __init__(self, task_path=TASK_FILE, log_path=None,
+                 stats_path=None, compact_threshold=COMPACT_THRESHOLD, archive_days=None):
+        self.task_path = task_path
+        # The change log and saved statistics are named after the snapshot
+        # unless other files are given, so task files in the same folder
+        # never apply or remove each other's logs
+        self.log_path = sidecar_path(task_path, TASK_LOG_SUFFIX) if log_path is None else log_path
+        self.stats_path = sidecar_path(task_path, TASK_STATS_SUFFIX) if stats_path is None else stats_path
+        self.compact_threshold = compact_threshold
+        # Archive of old completed tasks, also named after the snapshot, and
+        # the number of days tasks stay complete before they are archived
+        self.archive = TaskArchive(sidecar_path(task_path, TASK_ARCHIVE_SUFFIX))
+        self.archive_days = default_archive_days() if archive_days is None else archive_days
+        # Task list in task id order and index of task id to task
+        self.tasks = []
+        self.by_id = {}
+        # Id given to the next task added
+        self.next_id = 1
+        # Number of records in the change log since the last compaction
+        self.log_count = 0
+        self.loaded = False
+        # Per user statistics, only created once they are first needed, and
+        # the file signature they were read at until the task list is loaded
+        self.stats = None
+        self.stats_signature = None
+        # Index of username to a dictionary of that user's tasks by task id,
+        # only built once it is first needed
+        self.by_user = None
+        # Report columns (see task_columns.py), only built once they are
+        # first needed, and the file signature they were built at until the
+        # task list is loaded
+        self.columns = None
+        self.columns_signature = None
+        # Inode, size and modification time of the files when last read, and
+        # how many bytes of the change log have been applied
+        self.task_state = None
+        self.log_state = None
+        self.log_offset = 0
+        # Whether the change log is in the escaped format, which it is once
+        # it has been written by this version
+        self.log_escaped = True
+        # Lock file shared by every session, and how many times this store
+        # currently holds the lock
+        self.lock_path = task_path + ".lock"
+        self.lock_file = None
+        self.lock_depth = 0
+        # Line offset index of the snapshot file, for reading single tasks
+        self.file_map = TaskFileMap(task_path)
+
+    def load(self):
+        '''Reads the snapshot file and replays the change log on top of it'''
+        self._read_all()
+        # Read again if the snapshot was replaced while it was being read
+        while file_state(self.task_path) != self.task_state:
+            self._read_all()
+        self.loaded = True
+        return self
+
+    def _read_all(self):
+        '''Reads the snapshot file and the whole change log'''
+        self.tasks = []
+        self.by_id = {}
+        # Archived task ids are never handed out again either
+        self.next_id = self.archive.next_id()
+        self.log_count = 0
+        self.stats = None
+        self.by_user = None
+        self.columns = None
+        self.log_state = None
+        self.log_offset = 0
+        # Read in task data from the snapshot file
+        self.task_state = file_state(self.task_path)
+        if self.task_state is not None:
+            with open(self.task_path, 'r') as task_file:
+                task_data = task_file.read().split("\n")
+            escaped = task_data[0] == TASK_FILE_HEADER
+            for t_str in task_data[escaped:]:
+                if t_str != "":
+                    self._insert(parse_task(t_str, len(self.tasks) + 1, escaped))
+        # Apply every change recorded since the snapshot was written
+        self._read_log()
+
+    def refresh(self):
+        '''Makes sure the task list matches the files on disk, reloading only
+            what has changed since the files were last read:
+            - nothing, if neither file has changed
+            - the new records at the end of the change log, if it has grown
+            - everything, if the snapshot was rewritten or the log replaced
+        '''
+        if not self.loaded:
+            return self.load()
+        if file_state(self.task_path) != self.task_state:
+            return self.load()
+        log_state = file_state(self.log_path)
+        if log_state == self.log_state:
+            return self
+        log_replaced = log_state is None or (
+            self.log_state is not None and log_state[0] != self.log_state[0])
+        if log_replaced or log_state[1] < self.log_offset:
+            return self.load()
+        self._read_log()
+        return self
+
+    def iter_tasks(self):
+        '''Yields every task in task id order. Once the task list has been
+            loaded it is used directly; until then the snapshot file is read
+            one line at a time with the change log applied to each task, so
+            only the (short) change log is ever held in memory.
+        '''
+        if self.loaded:
+            yield from self.refresh().tasks
+            return
+        pending = self.pending_changes()
+        # Read the snapshot line by line, applying any logged changes
+        if os.path.exists(self.task_path):
+            with open(self.task_path, "r") as task_file:
+                line_number = 0
+                escaped = False
+                for t_str in task_file:
+                    t_str = t_str.rstrip("\n")
+                    if t_str == TASK_FILE_HEADER and line_number == 0:
+                        escaped = True
+                    elif t_str != "":
+                        line_number += 1
+                        task = parse_task(t_str, line_number, escaped)
+                        yield apply_changes(task, pending.pop(task.id, ()))
+        # Finally the tasks that were added after the snapshot was written
+        for task_id in sorted(pending):
+            task = apply_changes(None, pending[task_id])
+            if task is not None:
+                yield task
+
+    def pending_changes(self):
+        '''Reads the change log without applying it, and returns a dictionary
+            of task id to that task's (kind, changes) records in order
+        '''
+        pending = {}
+        if os.path.exists(self.log_path):
+            with open(self.log_path, "rb") as log_file:
+                escaped = False
+                for record in log_file:
+                    record = record.decode("utf-8").rstrip("\n")
+                    if record == TASK_LOG_HEADER:
+                        escaped = True
+                    elif record != "":
+                        kind, task_id, changes = parse_record(record, escaped)
+                        pending.setdefault(task_id, []).append((kind, changes))
+        return pending
+
+    def get(self, task_id):
+        '''Returns the task with the given task id, or None. Until the task
+            list is loaded, only the task's own snapshot line and logged
+            changes are read.
+        '''
+        if self.loaded:
+            return self.refresh().by_id.get(task_id)
+        changes = self.pending_changes().get(task_id, ())
+        return apply_changes(self.file_map.find(task_id), changes)
+
+    def tasks_for_user(self, username):
+        '''Returns the tasks assigned to a user in task id order, from the
+            username index so only that user's tasks are looked at
+        '''
+        self.refresh()
+        if self.by_user is None:
+            self.by_user = {}
+            for task in self.tasks:
+                self.by_user.setdefault(task.username, {})[task.id] = task
+        user_tasks = self.by_user.get(username, {})
+        return [user_tasks[task_id] for task_id in sorted(user_tasks)]
+
+    def overdue_tasks(self, today_ordinal):
+        '''Returns the incomplete tasks due today or earlier, in due date
+            order, from the due date index
+        '''
+        return self._incomplete_due(1, today_ordinal)
+
+    def tasks_due_within(self, days, today_ordinal):
+        '''Returns the incomplete tasks due after today and within the given
+            number of days, in due date order, from the due date index
+        '''
+        return self._incomplete_due(today_ordinal + 1, today_ordinal + days)
+
+    def _incomplete_due(self, first_ordinal, last_ordinal):
+        '''Returns the incomplete tasks due between two date ordinals'''
+        self.refresh()
+        task_ids = self.get_stats().incomplete_ids_due(first_ordinal, last_ordinal)
+        return [self.by_id[task_id] for task_id in task_ids]
+
+    def add(self, username, title, description, due_date, assigned_date, completed=False):
+        '''Adds a new task and records it in the change log'''
+        with self._locked():
+            # The lock makes sure no other session uses the same id
+            self.refresh()
+            task = Task(self.next_id, username, title, description,
+                        due_date.toordinal(), assigned_date.toordinal(), completed)
+            # Format the record first, so a bad field changes nothing
+            record = f"add;{format_task(task)}"
+            self._insert(task)
+            self._append(record)
+        return task
+
+    def add_many(self, rows):
+        '''Adds a batch of tasks from (username, title, description,
+            due_date, assigned_date, completed) rows, writing the task files
+            once for the whole batch, and returns the new tasks
+        '''
+        with self._locked():
+            self.refresh()
+            tasks = [
+                Task(task_id, username, title, description,
+                     due_date.toordinal(), assigned_date.toordinal(), completed)
+                for task_id, (username, title, description, due_date, assigned_date, completed)
+                in enumerate(rows, self.next_id)
+            ]
+            # Format every record before any task is added, so a bad field
+            # in any row leaves the task list as it was
+            records = [f"add;{format_task(task)}" for task in tasks]
+            for task in tasks:
+                self._insert(task)
+            self._append_all(records)
+        return tasks
+
+    def set_completed_many(self, task_ids, completed=True):
+        '''Changes the completion status of a batch of tasks, writing the
+            task files once. Nothing is changed if any task does not exist.
+        '''
+        with self._locked():
+            self.refresh()
+            task_ids = list(dict.fromkeys(task_ids))
+            missing = [task_id for task_id in task_ids if task_id not in self.by_id]
+            if missing:
+                raise ValueError(f"Task {missing[0]} does not exist")
+            tasks = [self._change(task_id, 'completed', completed) for task_id in task_ids]
+            flag = 'Yes' if completed else 'No'
+            self._append_all([f"update;{task_id};completed;{flag}" for task_id in task_ids])
+        return tasks
+
+    def reassign_all(self, from_username, to_username):
+        '''Assigns every task of one user to another user, found with the
+            username index and written to the task files once, and returns
+            the tasks that were changed
+        '''
+        with self._locked():
+            tasks = self.tasks_for_user(from_username)
+            for task in tasks:
+                self._change(task.id, 'username', to_username)
+            self._append_all([f"reassign;{task.id};{escape_field(to_username)}" for task in tasks])
+        return tasks
+
+    def set_completed(self, task_id, completed=True, expected=None):
+        '''Changes the completion status of a task. If expected is given
+            (see Task.fields) the task must still have those values, and
+            otherwise a ValueError is raised if the task does not exist.
+        '''
+        with self._locked():
+            if not self.loaded:
+                task = self._patch_completed(task_id, completed, expected)
+                if task is not None:
+                    return task
+            self._check(task_id, expected)
+            task = self._change(task_id, 'completed', completed)
+            self._append(f"update;{task_id};completed;{'Yes' if completed else 'No'}")
+        return task
+
+    def set_due_date(self, task_id, due_date, expected=None):
+        '''Changes the due date of a task. If expected is given (see
+            Task.fields) the task must still have those values, and
+            otherwise a ValueError is raised if the task does not exist.
+        '''
+        with self._locked():
+            self._check(task_id, expected)
+            task = self._change(task_id, 'due', due_date.toordinal())
+            self._append(f"update;{task_id};due_date;{format_ordinal(task.due)}")
+        return task
+
+    def reassign(self, task_id, username, expected=None):
+        '''Changes the user assigned to a task. If expected is given (see
+            Task.fields) the task must still have those values, and
+            otherwise a ValueError is raised if the task does not exist.
+        '''
+        with self._locked():
+            self._check(task_id, expected)
+            task = self._change(task_id, 'username', username)
+            self._append(f"reassign;{task_id};{escape_field(username)}")
+        return task
+
+    def signature(self):
+        '''Returns the inode, size and modification time of the snapshot and
+            log files, which changes whenever either file is written
+        '''
+        return [file_state(self.task_path), file_state(self.log_path)]
+
+    def get_stats(self):
+        '''Returns the per user task statistics. Until the task list is
+            loaded, the statistics saved with the snapshot are used with the
+            change log applied, which takes one step per incomplete task and
+            per logged change. Every task is only counted if the snapshot
+            has been rewritten without saving them.
+        '''
+        if self.loaded:
+            self.refresh()
+        else:
+            # Read the statistics again once another session changes the files
+            signature = self.signature()
+            if signature != self.stats_signature:
+                self.stats = self._saved_stats()
+                self.stats_signature = signature
+        if self.stats is None:
+            self.stats = TaskStats.from_tasks(self.iter_tasks())
+            self.stats.add_archived(self.archive.user_counts())
+        return self.stats
+
+    def _saved_stats(self):
+        '''Loads the statistics saved for the snapshot and applies the change
+            log to them, reading only the snapshot lines of the tasks it
+            changes. Returns None if there are no statistics saved for the
+            snapshot as it is now.
+        '''
+        task_state = file_state(self.task_path)
+        stats = TaskStats.load(self.stats_path, task_state)
+        if stats is None:
+            return None
+        for task_id, changes in self.pending_changes().items():
+            old_task = self.file_map.find(task_id)
+            new_task = apply_changes(old_task.copy() if old_task is not None else None, changes)
+            if old_task is not None:
+                stats.remove_task(old_task)
+            if new_task is not None:
+                stats.add_task(new_task)
+        # The snapshot lines read must be the ones the statistics counted
+        if file_state(self.task_path) != task_state:
+            return None
+        return stats
+
+    def get_columns(self):
+        '''Returns the report columns of every task that is not archived,
+            which are kept up to date as tasks change once the task list is
+            loaded
+        '''
+        if self.loaded:
+            self.refresh()
+        else:
+            # Build the columns again once another session changes the files
+            signature = self.signature()
+            if signature != self.columns_signature:
+                self.columns = None
+                self.columns_signature = signature
+        if self.columns is None:
+            self.columns = TaskColumns.from_tasks(self.iter_tasks())
+        return self.columns
+
+    def replace_all(self, tasks):
+        '''Replaces the whole task list and rewrites the snapshot file'''
+        with self._locked():
+            self.tasks = []
+            self.by_id = {}
+            self.next_id = self.archive.next_id()
+            for task in tasks:
+                self._insert(task)
+            self.loaded = True
+            self.stats = None
+            self.by_user = None
+            self.columns = None
+            self._write_snapshot()
+
+    def compact(self):
+        '''Rewrites the snapshot file from memory and empties the change log,
+            if there is a change log to empty
+        '''
+        with self._locked():
+            # Without a change log the snapshot already holds every task, so
+            # it is left alone along with its line index and saved statistics
+            if file_state(self.log_path) is None:
+                return
+            # Include any records written by other sessions before the log goes
+            self.refresh()
+            self._write_snapshot()
+
+    def _write_snapshot(self):
+        '''Replaces the snapshot file with the in-memory task list and
+            removes the change log, while holding the lock
+        '''
+        self._archive_completed()
+        lines = [TASK_FILE_HEADER]
+        lines.extend(format_task(t) for t in self.tasks)
+        write_atomic(self.task_path, "\n".join(lines))
+        # Only remove the log once the snapshot holds all of its changes
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+        self.log_count = 0
+        self.log_escaped = True
+        self.task_state = file_state(self.task_path)
+        self.log_state = None
+        self.log_offset = 0
+        # Save the statistics along with the state of the snapshot they
+        # count, which later sessions bring up to date with the change log
+        self.get_stats().save(self.stats_path, self.task_state)
+
+    @contextmanager
+    def _locked(self):
+        '''Holds the lock shared by all sessions for the length of a with
+            block; nested with blocks keep the same lock
+        '''
+        if self.lock_depth == 0 and fcntl is not None:
+            self.lock_file = open(self.lock_path, "a")
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        self.lock_depth += 1
+        try:
+            yield
+        finally:
+            self.lock_depth -= 1
+            if self.lock_depth == 0 and self.lock_file is not None:
+                fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+                self.lock_file.close()
+                self.lock_file = None
+
+    def _archive_completed(self):
+        '''Moves tasks completed more than archive_days ago from the task
+            list to the archive, before the snapshot is written without them.
+            Tasks seen complete for the first time are recorded as completed
+            today, and reopened tasks are forgotten.
+        '''
+        if self.archive_days <= 0:
+            return
+        today = date.today().toordinal()
+        saved_days = self.archive.completion_days()
+        completion_days = {task.id: saved_days.get(task.id, today) for task in self.tasks if task.completed}
+        cutoff = today - self.archive_days
+        old_tasks = [task for task in self.tasks if task.completed and completion_days[task.id] < cutoff]
+        if old_tasks:
+            # The archive is written first, so a task is never missing from both
+            self.archive.add(old_tasks)
+            for task in old_tasks:
+                del completion_days[task.id]
+                del self.by_id[task.id]
+                if self.by_user is not None:
+                    self.by_user.get(task.username, {}).pop(task.id, None)
+                if self.columns is not None:
+                    self.columns.remove_task(task)
+            self.tasks = [task for task in self.tasks if task.id in self.by_id]
+            # The statistics need no change, as an archived task counts towards
+            # its user's total and complete tasks just as it did before, while
+            # the reports add the archive counts to the columns
+        if completion_days != saved_days:
+            self.archive.save_completion_days(completion_days)
+
+    def _check(self, task_id, expected):
+        '''Reads any changes from other sessions, then raises a
+            TaskConflictError if the task no longer has the expected values,
+            or a ValueError if no values were expected and the task does not
+            exist
+        '''
+        self.refresh()
+        task = self.by_id.get(task_id)
+        # A task archived by another session has changed as well
+        if expected is not None and (task is None or task.fields() != tuple(expected)):
+            raise TaskConflictError(f"Task {task_id} was changed by another session")
+        if task is None:
+            raise ValueError(f"Task {task_id} does not exist")
+
+    def _patch_completed(self, task_id, completed, expected):
+        '''Changes the completion status of a task by overwriting its line in
+            the snapshot file, without loading the task list. Returns None if
+            the task has logged changes or its line cannot be changed in
+            place, in which case the change is logged as usual.
+        '''
+        if task_id in self.pending_changes():
+            return None
+        old_state = file_state(self.task_path)
+        task = self.file_map.find(task_id)
+        if task is None:
+            return None
+        if expected is not None and task.fields() != tuple(expected):
+            raise TaskConflictError(f"Task {task_id} was changed by another session")
+        if not self.file_map.patch_completed(task_id, completed):
+            return None
+        old_task = task.copy()
+        task.completed = completed
+        self._patch_stats(old_task, task, old_state)
+        # Record the day the task was completed, as a snapshot rewrite does
+        # for logged completions, so it is archived once it is old enough
+        self.archive.record_completion(task_id, date.today().toordinal() if completed else None)
+        return task
+
+    def _patch_stats(self, old_task, new_task, old_state):
+        '''Brings the saved and in-memory statistics up to date after a task
+            line of the snapshot was changed in place, so they stay valid for
+            the snapshot as it is now
+        '''
+        saved = TaskStats.load(self.stats_path, old_state)
+        if saved is None:
+            # Statistics saved for another snapshot are of no further use
+            if os.path.exists(self.stats_path):
+                os.remove(self.stats_path)
+        else:
+            saved.remove_task(old_task)
+            saved.add_task(new_task)
+            saved.save(self.stats_path, file_state(self.task_path))
+        if self.stats is not None and self.stats_signature == [old_state, file_state(self.log_path)]:
+            # The task had no logged changes, so the statistics of this
+            # session counted it as it was on its snapshot line
+            self.stats.remove_task(old_task)
+            self.stats.add_task(new_task)
+            self.stats_signature = self.signature()
+        else:
+            self.stats = None
+            self.stats_signature = None
+
+    def _insert(self, task):
+        '''Adds a task to the task list and the task id index, or updates the
+            task if it is already there
+        '''
+        existing = self.by_id.get(task.id)
+        if existing is not None:
+            # Replaying an add that has already been applied
+            self._unindex(existing)
+            existing.update(task)
+            task = existing
+        else:
+            self.tasks.append(task)
+            self.by_id[task.id] = task
+            # Never hand out an id that has already been used
+            self.next_id = max(self.next_id, task.id + 1)
+        self._index(task)
+
+    def _index(self, task):
+        '''Adds a task to the statistics, username index and report columns,
+            if they exist
+        '''
+        if self.stats is not None:
+            self.stats.add_task(task)
+        if self.by_user is not None:
+            self.by_user.setdefault(task.username, {})[task.id] = task
+        if self.columns is not None:
+            self.columns.add_task(task)
+
+    def _unindex(self, task):
+        '''Removes a task from the statistics, username index and report
+            columns, called before the task is changed
+        '''
+        if self.stats is not None:
+            self.stats.remove_task(task)
+        if self.by_user is not None:
+            self.by_user.get(task.username, {}).pop(task.id, None)
+        if self.columns is not None:
+            self.columns.remove_task(task)
+
+    def _change(self, task_id, field, value):
+        '''Changes one field of a task, keeping the statistics and username
+            index up to date
+        '''
+        task = self.by_id[task_id]
+        self._unindex(task)
+        setattr(task, field, value)
+        self._index(task)
+        return task
+
+    def _apply(self, record):
+        '''Applies a single change log record to the in-memory task list'''
+        kind, task_id, changes = parse_record(record, self.log_escaped)
+        if kind == "add":
+            self._insert(changes)
+        # Updates to a task that is not in the task list, such as one that
+        # has since been archived, are skipped as in apply_changes
+        elif task_id in self.by_id:
+            for field, value in changes.items():
+                self._change(task_id, field, value)
+
+    def _read_log(self):
+        '''Applies the change log records written since it was last read'''
+        self.log_state = file_state(self.log_path)
+        if self.log_state is None:
+            self.log_escaped = True
+            return
+        with open(self.log_path, "rb") as log_file:
+            log_file.seek(self.log_offset)
+            data = log_file.read()
+        # Leave any half written record at the end for the next read
+        end = data.rfind(b"\n") + 1
+        if self.log_offset == 0:
+            # A log is in the escaped format if it starts with the header,
+            # or if nothing has been written to it yet
+            self.log_escaped = end == 0
+        for record in data[:end].decode("utf-8").split("\n"):
+            if record == TASK_LOG_HEADER:
+                self.log_escaped = True
+            elif record != "":
+                self._apply(record)
+                self.log_count += 1
+        self.log_offset += end
+
+    def _append(self, record):
+        '''Appends a record to the change log, compacting when it is full'''
+        self._append_all([record])
+
+    def _append_all(self, records):
+        '''Appends records to the change log in a single write, or rewrites
+            the snapshot instead if they would fill the log, so a batch of
+            changes writes the task files exactly once
+        '''
+        if not records:
+            return
+        # A log from before the escaped format is never mixed with escaped
+        # records, it is merged into the snapshot instead
+        if self.log_count + len(records) >= self.compact_threshold or not self.log_escaped:
+            # The in-memory list already has the changes, and the lock is
+            # held, so the snapshot can be written without reading the log
+            self._write_snapshot()
+            return
+        data = "".join(record + "\n" for record in records).encode("utf-8")
+        with open(self.log_path, "ab") as log_file:
+            # A new log starts with the header of the escaped format
+            if log_file.tell() == 0:
+                data = (TASK_LOG_HEADER + "\n").encode("utf-8") + data
+            log_file.write(data)
+            end = log_file.tell()
+        self.log_count += len(records)
+        # If nothing else was written to the log since it was last read, the
+        # new records are already applied; otherwise the next refresh reads
+        # them along with the other records (applying a record twice is
+        # harmless)
+        if end - len(data) == self.log_offset:
+            self.log_offset = end
+            self.log_state = file_state(self.log_path)
@@ -0,0 +1,76 @@
+"""
+=================================USER STORE=================================
+This module keeps the parsed user.txt file in memory so the Task Manager
+does not read and split the file every time it checks a username.
+
+The file is only read again when its modification time or size has
+changed since it was last read, which is checked with a single os.stat
+call, so repeated checks in a validation loop cost almost nothing.
+"""
+
+# Import libraries
+import os
+from task_files import write_atomic
+
+# Default file name for the usernames and passwords
+USER_FILE = "user.txt"
+
+
+class UserStore:
+    '''Cached dictionary of usernames and passwords read from the user file'''
+
+    def __init__(self, user_path=USER_FILE):
+        self.user_path = user_path
+        self.username_password = {}
+        # Modification time and size of the user file when it was last read
+        self.signature = None
+
+    def users(self):
+        '''Returns the dictionary of usernames and passwords, reading the
+            user file again only if it has changed
+        '''
+        file_stat = os.stat(self.user_path)
+        signature = (file_stat.st_mtime_ns, file_stat.st_size)
+        if signature != self.signature:
+            # Create a username_password dictionary from the user file
+            with open(self.user_path, "r") as user_file:
+                user_data = user_file.read().split("\n")
+            username_password = {}
+            for user in user_data:
+                username, password = user.split(';')
+                username_password[username] = password
+            self.username_password = username_password
+            self.signature = signature
+        return self.username_password
+
+    def __contains__(self, username):
+        return username in self.users()
+
+    def __len__(self):
+        return len(self.users())
+
+    def password(self, username):
+        '''Returns the stored password of a user, or None'''
+        return self.users().get(username)
+
+    def add_user(self, username, password):
+        '''Adds a new user to the end of the user file'''
+        username_password = self.users()
+        with open(self.user_path, "a") as user_file:
+            user_file.write(f"\n{username};{password}")
+        # Update the cache directly rather than reading the file again
+        username_password[username] = password
+        file_stat = os.stat(self.user_path)
+        self.signature = (file_stat.st_mtime_ns, file_stat.st_size)
+
+    def set_passwords(self, username_password):
+        '''Replaces the stored passwords of existing users, rewriting the
+            user file once
+        '''
+        users = dict(self.users())
+        users.update(username_password)
+        write_atomic(self.user_path, "\n".join(f"{k};{v}" for k, v in users.items()))
+        # Update the cache directly rather than reading the file again
+        self.username_password = users
+        file_stat = os.stat(self.user_path)
+        self.signature = (file_stat.st_mtime_ns, file_stat.st_size)